@@ -0,0 +1,155 @@
+import argparse
+import json
+import os
+import time
+
+from buff_registry import BUFFS, registerBuffs, trackedBuffs
+
+class AlertRule:
+    """Fires once when a buff reaches `threshold` stacks, re-arms when it drops below.
+
+    `cooldown` is the minimum number of seconds between two firings.
+    """
+
+    __slots__ = ('buff', 'threshold', 'sound', 'cooldown', 'volume', 'armed', 'last_fired')
+
+    def __init__(self, buff, threshold, sound, cooldown=0, volume=1.0):
+        self.buff = buff
+        self.threshold = threshold
+        self.sound = sound
+        self.cooldown = cooldown
+        self.volume = volume
+        self.armed = True
+        self.last_fired = None
+
+    def update(self, count, now):
+        if count < self.threshold:
+            self.armed = True
+            return False
+        if not self.armed:
+            return False
+        self.armed = False
+        # A crossing inside the cooldown is swallowed rather than played late
+        if self.last_fired is not None and now - self.last_fired < self.cooldown:
+            return False
+        self.last_fired = now
+        return True
+
+def alertRules(config, base_path, tracked_buffs):
+    """Builds the alert rules of the tracked buffs from config.json's `alerts`, falling back to each buff's registered alert.
+
+    A buff set to false has no alert. Relative sound paths are looked up in
+    the working directory first and then next to the bundled assets.
+    """
+    settings = {name: dict(buff.alert) for name, buff in BUFFS.items() if buff.alert}
+    for name, alert in config.get('alerts', {}).items():
+        if not alert:
+            settings.pop(name, None)
+        else:
+            settings[name] = dict(settings.get(name, {}), **alert)
+
+    rules = []
+    for name, alert in settings.items():
+        if name not in tracked_buffs or 'threshold' not in alert or not alert.get('sound'):
+            continue
+        sound = alert['sound']
+        if not os.path.isabs(sound) and not os.path.exists(sound):
+            sound = os.path.join(base_path, sound)
+        rules.append(AlertRule(name, alert['threshold'], sound, alert.get('cooldown', 0), alert.get('volume', 1.0)))
+    return rules
+
+class NullAudioDriver:
+    """Plays nothing and remembers what it was asked to play, for headless machines and tests."""
+
+    def __init__(self, rules=()):
+        self.played = []
+
+    def play(self, rule):
+        self.played.append(rule.buff)
+
+    def stop(self):
+        pass
+
+class PygameAudioDriver:
+    """Decodes every alert sound into memory once and plays each on its own reserved mixer channel.
+
+    Sound.play only queues the buffer with SDL, so playing never blocks
+    and alerts of different buffs never cut each other off. Drivers of
+    several gauges use channels from their own `first_channel` on.
+    """
+
+    def __init__(self, rules, first_channel=0):
+        import pygame
+        if not pygame.mixer.get_init():
+            pygame.mixer.init()
+        used_channels = first_channel + len(rules)
+        pygame.mixer.set_num_channels(max(8, used_channels, pygame.mixer.get_num_channels()))
+        pygame.mixer.set_reserved(used_channels)
+        self.sounds = {}
+        self.channels = {}
+        for i, rule in enumerate(rules):
+            sound = pygame.mixer.Sound(rule.sound)
+            sound.set_volume(rule.volume)
+            self.sounds[rule.buff] = sound
+            self.channels[rule.buff] = pygame.mixer.Channel(first_channel + i)
+
+    def play(self, rule):
+        self.channels[rule.buff].play(self.sounds[rule.buff])
+
+    def stop(self):
+        for channel in self.channels.values():
+            channel.stop()
+
+def createAudioDriver(rules, driver_name='pygame', first_channel=0):
+    if driver_name == 'null':
+        return NullAudioDriver(rules)
+    return PygameAudioDriver(rules, first_channel)
+
+class AlertEngine:
+    """Turns stack counts into alert sounds.
+
+    Counts are checked as soon as they arrive, sounds only play once a
+    driver is attached, so the mixer can start on another thread.
+    """
+
+    def __init__(self, rules, clock=time.monotonic):
+        self.rules = rules
+        self.clock = clock
+        self.driver = None
+
+    def setDriver(self, driver):
+        self.driver = driver
+
+    def observe(self, counts):
+        """Plays the alerts this update of counts fires and returns their buffs."""
+        now = self.clock()
+        fired = [rule for rule in self.rules if rule.update(counts.get(rule.buff, 0), now)]
+        if self.driver is not None:
+            for rule in fired:
+                self.driver.play(rule)
+        return [rule.buff for rule in fired]
+
+    def hotCounts(self):
+        # One step below each threshold, the tick scheduler polls fast from there
+        return {rule.buff: rule.threshold - BUFFS[rule.buff].step for rule in self.rules}
+
+    def stop(self):
+        if self.driver is not None:
+            self.driver.stop()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Plays every alert configured in config.json once.")
+    parser.add_argument('--driver', default='pygame', choices=['pygame', 'null'])
+    args = parser.parse_args()
+
+    config = {}
+    if os.path.exists('config.json'):
+        with open('config.json', 'r') as f:
+            config = json.load(f)
+    registerBuffs(config)
+    rules = alertRules(config, os.path.abspath('.'), trackedBuffs(config))
+    driver = createAudioDriver(rules, args.driver)
+    for rule in rules:
+        print(f"{rule.buff}: {rule.threshold} stacks, {rule.sound}, cooldown {rule.cooldown} s")
+        driver.play(rule)
+        time.sleep(1.5)
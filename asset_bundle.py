@@ -0,0 +1,210 @@
+import argparse
+import hashlib
+import json
+import os
+import struct
+
+import numpy as np
+
+from atomic_write import atomicPath
+from buff_registry import BUFFS
+from template_bank import loadTemplate
+from overlay_render import loadRenderLayers
+from template_synthesis import SYNTHESIZED_ASSETS
+
+BUNDLE_MAGIC = b'NGBUNDL1'
+BUNDLE_VERSION = 1
+# Array data starts on this boundary so every mapped array is aligned
+BUNDLE_ALIGNMENT = 64
+# Scaled render layer sets kept in a bundle, the oldest scale is dropped beyond this
+MAX_BUNDLED_SCALES = 4
+
+def scaleKey(scale):
+    return f'{scale:.6g}'
+
+def templateKey(template_dir, file_name):
+    return f'templates/{template_dir}/{file_name}'
+
+def renderKey(scale, name, count):
+    return f'render/{scaleKey(scale)}/{name}/{count}'
+
+def templateDirs(base_path, custom_path):
+    """Every folder holding buff templates, as (key, path), with keys relative to the assets, custom_assets or synthesized_assets root."""
+    template_files = {f'{file_name}.png' for buff in BUFFS.values() for file_name, _ in buff.templates}
+    roots = [('assets', os.path.join(base_path, 'assets')), ('custom_assets', custom_path), (SYNTHESIZED_ASSETS, SYNTHESIZED_ASSETS)]
+    dirs = []
+    for root_key, root_path in roots:
+        if not os.path.isdir(root_path):
+            continue
+        for dir_path, dir_names, file_names in os.walk(root_path):
+            dir_names.sort()
+            if template_files.intersection(file_names):
+                relative = os.path.relpath(dir_path, root_path).replace(os.sep, '/')
+                dirs.append((root_key if relative == '.' else f'{root_key}/{relative}', dir_path))
+    return dirs
+
+def sourceFiles(base_path, custom_path):
+    """Every PNG the bundle is built from, as (key, path)."""
+    render_assets_path = os.path.join(base_path, 'assets', 'modular_render_assets')
+    files = [(f'assets/modular_render_assets/{file_name}.png', os.path.join(render_assets_path, f'{file_name}.png')) for buff in BUFFS.values() for file_name, _ in buff.render_layers]
+    for template_dir, dir_path in templateDirs(base_path, custom_path):
+        files.extend((f'{template_dir}/{name}', os.path.join(dir_path, name)) for name in sorted(os.listdir(dir_path)) if name.endswith('.png'))
+    return files
+
+def contentHash(base_path, custom_path):
+    """Hash of every source PNG's name and bytes, a changed, added or removed asset changes it."""
+    digest = hashlib.sha256()
+    for key, path in sourceFiles(base_path, custom_path):
+        digest.update(key.encode())
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+def writeBundle(path, arrays, meta):
+    """Writes named arrays into one file: magic, header length, JSON header, then aligned raw data."""
+    entries = {}
+    offset = 0
+    for key, array in arrays.items():
+        offset = -(-offset // BUNDLE_ALIGNMENT) * BUNDLE_ALIGNMENT
+        entries[key] = {'offset': offset, 'shape': list(array.shape), 'dtype': array.dtype.str}
+        offset += array.nbytes
+    header = json.dumps(dict(meta, version=BUNDLE_VERSION, entries=entries)).encode()
+    data_start = -(-(len(BUNDLE_MAGIC) + 8 + len(header)) // BUNDLE_ALIGNMENT) * BUNDLE_ALIGNMENT
+
+    with atomicPath(path) as temp_path, open(temp_path, 'wb') as f:
+        f.write(BUNDLE_MAGIC)
+        f.write(struct.pack('<Q', len(header)))
+        f.write(header)
+        for key, array in arrays.items():
+            f.seek(data_start + entries[key]['offset'])
+            f.write(np.ascontiguousarray(array).data)
+
+class AssetBundle:
+    """Read-only view of a bundle file, every array is a slice of one memory map."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.read(len(BUNDLE_MAGIC)) != BUNDLE_MAGIC:
+                raise ValueError(f"{path} is not an asset bundle")
+            header_length, = struct.unpack('<Q', f.read(8))
+            self.header = json.loads(f.read(header_length))
+        if self.header.get('version') != BUNDLE_VERSION:
+            raise ValueError(f"{path} has bundle version {self.header.get('version')}, expected {BUNDLE_VERSION}")
+        self.content_hash = self.header.get('content_hash')
+        self.scales = self.header.get('scales', [])
+        self.data_start = -(-(len(BUNDLE_MAGIC) + 8 + header_length) // BUNDLE_ALIGNMENT) * BUNDLE_ALIGNMENT
+        self.memory_map = np.memmap(path, dtype=np.uint8, mode='r')
+
+    def __contains__(self, key):
+        return key in self.header['entries']
+
+    def get(self, key):
+        entry = self.header['entries'].get(key)
+        if entry is None:
+            return None
+        dtype = np.dtype(entry['dtype'])
+        start = self.data_start + entry['offset']
+        size = int(np.prod(entry['shape'])) * dtype.itemsize
+        return self.memory_map[start:start + size].view(dtype).reshape(entry['shape'])
+
+    def hasScale(self, scale):
+        return scaleKey(scale) in self.scales
+
+    def templates(self, template_dir):
+        """The packed grayscale templates of one asset folder, by file name."""
+        templates = {}
+        for buff in BUFFS.values():
+            for file_name, _ in buff.templates:
+                template = self.get(templateKey(template_dir, file_name))
+                if template is not None:
+                    templates[file_name] = template
+        return templates
+
+    def renderLayers(self, scale, buffs=None):
+        layers = {
+            name: {count: self.get(renderKey(scale, name, count)) for _, count in buff.render_layers} if buffs is None or name in buffs else {}
+            for name, buff in BUFFS.items()
+        }
+        # Layer files missing when the bundle was built have no entry
+        return {name: {count: layer for count, layer in buff_layers.items() if layer is not None} for name, buff_layers in layers.items()}
+
+    def close(self):
+        # The file is unmapped once no array handed out still points into it
+        self.memory_map = None
+
+def buildBundle(path, base_path, custom_path, scales, content_hash=None, previous=None):
+    """Packs the templates of every asset folder and the render layers pre-scaled to each of `scales`.
+
+    Render layers of scales already in `previous` (a bundle of the same
+    content hash) are copied over instead of decoded again.
+    """
+    arrays = {}
+    for template_dir, dir_path in templateDirs(base_path, custom_path):
+        for buff in BUFFS.values():
+            for file_name, _ in buff.templates:
+                template = loadTemplate(dir_path, file_name)
+                if template is not None:
+                    arrays[templateKey(template_dir, file_name)] = template
+
+    render_assets_path = os.path.join(base_path, 'assets', 'modular_render_assets')
+    for scale in scales:
+        if previous is not None and previous.hasScale(scale):
+            render_assets = {name: {count: np.array(layer) for count, layer in layers.items()} for name, layers in previous.renderLayers(scale).items()}
+        else:
+            render_assets = loadRenderLayers(render_assets_path, scale)
+        for name, layers in render_assets.items():
+            for count, layer in layers.items():
+                arrays[renderKey(scale, name, count)] = layer
+    if previous is not None:
+        previous.close()
+
+    meta = {'content_hash': content_hash or contentHash(base_path, custom_path), 'scales': [scaleKey(scale) for scale in scales]}
+    writeBundle(path, arrays, meta)
+
+def openAssetBundle(path, base_path, custom_path, scale):
+    """Maps the bundle at `path`, rebuilding it first when the assets changed or `scale` is missing.
+
+    `scale` can also be a list, e.g. the scales of several profiles.
+    """
+    wanted = [scale] if isinstance(scale, (int, float)) else list(dict.fromkeys(scale))
+    content_hash = contentHash(base_path, custom_path)
+    bundle = None
+    if os.path.exists(path):
+        try:
+            bundle = AssetBundle(path)
+        except Exception as e:
+            print(f"Rebuilding asset bundle: {e}")
+    if bundle is not None and bundle.content_hash == content_hash and all(bundle.hasScale(scale) for scale in wanted):
+        return bundle
+
+    if bundle is not None and bundle.content_hash == content_hash:
+        wanted_keys = {scaleKey(scale) for scale in wanted}
+        kept = [float(key) for key in bundle.scales if key not in wanted_keys]
+        scales = kept[max(0, len(kept) - max(0, MAX_BUNDLED_SCALES - len(wanted))):] + wanted
+    else:
+        if bundle is not None:
+            bundle.close()
+            bundle = None
+        scales = wanted
+    buildBundle(path, base_path, custom_path, scales, content_hash, bundle)
+    return AssetBundle(path)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Packs templates and pre-scaled render layers into one memory-mappable bundle.')
+    parser.add_argument('--output', default='asset_bundle.bin')
+    parser.add_argument('--scale', type=float, action='append', help='Gauge scale to pre-scale the render layers for, can be repeated. Defaults to the scale in config.json.')
+    parser.add_argument('--custom-assets', default='custom_assets')
+    args = parser.parse_args()
+
+    scales = args.scale
+    if not scales:
+        scales = [1 / 6.5]
+        if os.path.exists('config.json'):
+            with open('config.json', 'r') as f:
+                scales = [json.load(f).get('scale', 1 / 6.5)]
+    base_path = os.path.abspath('.')
+    buildBundle(args.output, base_path, args.custom_assets, scales)
+    bundle = AssetBundle(args.output)
+    print(f"Packed {len(bundle.header['entries'])} arrays for scales {', '.join(bundle.scales)} into {args.output} ({os.path.getsize(args.output) / 1024 / 1024:.1f} MB)")
@@ -0,0 +1,29 @@
+import contextlib
+import os
+import shutil
+
+@contextlib.contextmanager
+def atomicPath(path):
+    """Yields a temp path next to `path`, a file or a folder, and swaps it in once the block finishes.
+
+    Readers only ever see the old version or the complete new one, so a crash
+    mid-write never leaves the app loading half a file or folder. A failed
+    write leaves `path` untouched.
+    """
+    temp_path = f'{path}.tmp'
+    removePath(temp_path)
+    try:
+        yield temp_path
+    except BaseException:
+        removePath(temp_path)
+        raise
+    # os.replace can swap a file over a file but not a folder over a non-empty folder
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    os.replace(temp_path, path)
+
+def removePath(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
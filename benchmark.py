@@ -0,0 +1,181 @@
+import argparse
+import json
+import os
+import random
+import time
+
+import cv2
+import numpy as np
+
+from buff_registry import BUFFS, registerBuffs
+from template_bank import availableAssetSets, loadTemplate
+from detector import NecroDetector
+from frame_recording import FrameRecorder, FrameRecording
+
+# Reported before and after the per-buff stages
+BENCH_STAGES = ('read', 'gray', 'change')
+
+def synthesizeRecording(asset_path_prefix, path, frames=300, roi_size=(795, 213), asset_set=None, seed=1):
+    """Builds a labelled recording by pasting the set's own templates onto a noisy buff bar.
+
+    Every registered buff gets a label column. Counts drift by one step
+    every few frames like they do in combat. Buffs without templates in the
+    set are labelled -1 and left out of accuracy.
+    """
+    rng = random.Random(seed)
+    noise_rng = np.random.default_rng(seed)
+    width, height = roi_size
+    icons = {name: {count: loadTemplate(asset_path_prefix, file_name) for file_name, count in buff.templates if not file_name.endswith('_alt')} for name, buff in BUFFS.items()}
+    steps = {name: (buff.step, buff.max_stacks) for name, buff in BUFFS.items()}
+    counts = {name: 0 for name in BUFFS}
+    with FrameRecorder(path, asset_set, {'left': 0, 'top': 0, 'width': width, 'height': height}, columns=list(BUFFS)) as recorder:
+        for i in range(frames):
+            if i % 5 == 0:
+                for name, (step, maximum) in steps.items():
+                    counts[name] = max(0, min(maximum, counts[name] + rng.choice([-step, 0, step])))
+            frame = np.full((height, width, 4), 30, dtype=np.uint8)
+            frame[..., :3] += noise_rng.integers(0, 6, (height, width, 1), dtype=np.uint8)
+            frame[..., 3] = 255
+            x = 20
+            label = []
+            for name in BUFFS:
+                if not any(icon is not None for icon in icons[name].values()):
+                    label.append(-1)
+                    continue
+                icon = icons[name].get(counts[name])
+                if icon is None or x + icon.shape[1] > width:
+                    # Missing icon for this count (e.g. soul_3 at 1080p/125%), or no room left on the bar, treat as absent
+                    label.append(0)
+                    continue
+                icon = cv2.cvtColor(icon, cv2.COLOR_GRAY2BGR)
+                top = (height - icon.shape[0]) // 2
+                frame[top:top + icon.shape[0], x:x + icon.shape[1], :3] = icon
+                x += icon.shape[1] + 6
+                label.append(counts[name])
+            recorder.append(frame, label)
+    return FrameRecording(path)
+
+def percentiles(values):
+    if not values:
+        return {'p50': 0.0, 'p95': 0.0, 'p99': 0.0}
+    p50, p95, p99 = np.percentile(np.array(values), [50, 95, 99])
+    return {'p50': float(p50), 'p95': float(p95), 'p99': float(p99)}
+
+def labelAccuracy(recording, predictions):
+    """Share of labelled frames counted right per buff, `predictions` has one column per registered buff."""
+    accuracy = {}
+    if recording.labels is not None:
+        buff_names = list(BUFFS)
+        for column, name in enumerate(recording.columns):
+            known = recording.labels[:, column] >= 0
+            if name in BUFFS and known.any():
+                accuracy[name] = float((predictions[known, buff_names.index(name)] == recording.labels[known, column]).mean())
+    return accuracy
+
+def runBenchmark(recording, asset_path_prefix, config):
+    """Replays a recording frame by frame through the detector without any Qt, timing every stage in ms."""
+    detector = NecroDetector(config, asset_path_prefix)
+    timings = {'read': [], 'total': []}
+    predictions = np.zeros((len(recording), len(BUFFS)), dtype=np.int16)
+    skipped = 0
+    bench_start = time.perf_counter()
+    for i in range(len(recording)):
+        start_time = time.perf_counter()
+        frame = np.array(recording.frames[i])
+        timings['read'].append((time.perf_counter() - start_time) * 1000)
+        detection = detector.detect(frame, timings)
+        timings['total'].append((time.perf_counter() - start_time) * 1000)
+        if not detection.matched:
+            skipped += 1
+        predictions[i] = [detection.counts[name] for name in BUFFS]
+    elapsed = time.perf_counter() - bench_start
+
+    result = {
+        'frames': len(recording),
+        'skipped': skipped,
+        'fps': len(recording) / elapsed if elapsed else 0.0,
+        'latency_ms': {stage: percentiles(timings[stage]) for stage in (*BENCH_STAGES, *BUFFS, 'total') if timings.get(stage)},
+        'accuracy': labelAccuracy(recording, predictions),
+    }
+    if detector.priors:
+        matched = len(recording) - skipped
+        result['template_calls_per_match'] = {name: prior.template_calls / max(1, matched) for name, prior in detector.priors.items()}
+    return result, predictions
+
+def runBatchBenchmark(recording, asset_path_prefix, config, batch_size=256):
+    """Runs a whole recording through detectBatch, reporting throughput and accuracy."""
+    detector = NecroDetector(config, asset_path_prefix)
+    start_time = time.perf_counter()
+    # Repeated frames are stored once, their result is copied to every tick they lasted
+    predictions, _ = detector.detectBatch(recording.stored_frames, batch_size)
+    elapsed = time.perf_counter() - start_time
+    predictions = predictions[recording.frame_index]
+    return {
+        'frames': len(recording),
+        'skipped': 0,
+        'fps': len(recording) / elapsed if elapsed else 0.0,
+        'latency_ms': {'total': {'p50': elapsed * 1000 / max(1, len(recording)), 'p95': 0.0, 'p99': 0.0}},
+        'accuracy': labelAccuracy(recording, predictions),
+    }
+
+def printReport(asset_set, result):
+    accuracy = ', '.join(f'{name} {value:.1%}' for name, value in result['accuracy'].items()) or 'no labels'
+    print(f"{asset_set}: {result['frames']} frames, {result['skipped']} skipped, {result['fps']:.0f} fps, accuracy {accuracy}")
+    if 'template_calls_per_match' in result:
+        calls = ', '.join(f'{name} {value:.1f}' for name, value in result['template_calls_per_match'].items())
+        print(f"    matchTemplate calls per matched frame: {calls}")
+    if 'prior_mismatches' in result:
+        print(f"    frames differing from a run without template prior: {result['prior_mismatches']}")
+    for stage, values in result['latency_ms'].items():
+        print(f"    {stage:<12} p50 {values['p50']:7.3f}  p95 {values['p95']:7.3f}  p99 {values['p99']:7.3f} ms")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Headless replay benchmark of the detection pipeline.')
+    parser.add_argument('recordings', nargs='*', help='Recording folders to replay. Their meta.json names the asset set.')
+    parser.add_argument('--asset-set', help="Asset set to match with, e.g. 'reso_3840x2160/150/medium'. Overrides the recording's own.")
+    parser.add_argument('--synthesize', type=int, metavar='FRAMES', help='Build a labelled synthetic recording for every asset set under assets/reso_* and benchmark those.')
+    parser.add_argument('--synthesize-to', default='bench_recordings', help='Where synthetic recordings are written.')
+    parser.add_argument('--match-mode', default='exhaustive', choices=['exhaustive', 'pyramid', 'fft'])
+    parser.add_argument('--no-slot-lock', action='store_true')
+    parser.add_argument('--no-skip-unchanged', action='store_true')
+    parser.add_argument('--no-template-prior', action='store_true')
+    parser.add_argument('--verify-prior', action='store_true', help='Replay again without the template prior and count frames whose results differ.')
+    parser.add_argument('--batch', action='store_true', help='Benchmark the batch API instead of frame-by-frame detection.')
+    parser.add_argument('--json', help='Also write the results to this file, for comparing runs.')
+    args = parser.parse_args()
+
+    # Buffs declared in config.json are synthesized, detected and scored like the built-in ones
+    if os.path.exists('config.json'):
+        with open('config.json', 'r') as f:
+            registerBuffs(json.load(f))
+    base_path = os.path.abspath('.')
+    jobs = []
+    for path in args.recordings:
+        recording = FrameRecording(path)
+        jobs.append((args.asset_set or recording.asset_set, recording))
+    if args.synthesize:
+        for asset_set in availableAssetSets(base_path):
+            asset_path_prefix = os.path.join(base_path, 'assets', *asset_set.split('/'))
+            path = os.path.join(args.synthesize_to, asset_set.replace('/', '_'))
+            jobs.append((asset_set, synthesizeRecording(asset_path_prefix, path, args.synthesize, asset_set=asset_set)))
+    if not jobs:
+        parser.error('give at least one recording or --synthesize')
+
+    config = {'match_mode': args.match_mode, 'slot_lock': not args.no_slot_lock, 'skip_unchanged_frames': not args.no_skip_unchanged, 'template_prior': not args.no_template_prior}
+    results = {}
+    for asset_set, recording in jobs:
+        if not asset_set:
+            parser.error(f'{recording.path} does not name its asset set, pass --asset-set')
+        asset_path_prefix = os.path.join(base_path, 'assets', *asset_set.split('/'))
+        if args.batch:
+            result = runBatchBenchmark(recording, asset_path_prefix, config)
+        else:
+            result, predictions = runBenchmark(recording, asset_path_prefix, config)
+            if args.verify_prior:
+                _, expected = runBenchmark(recording, asset_path_prefix, dict(config, template_prior=False))
+                result['prior_mismatches'] = int((predictions != expected).any(axis=1).sum())
+        results[f'{asset_set}@{recording.path}'] = result
+        printReport(asset_set, result)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
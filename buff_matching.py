@@ -0,0 +1,376 @@
+import sys
+import threading
+import time
+from functools import partial
+
+import cv2
+import numpy as np
+
+# Minimum TM_CCOEFF_NORMED score for a template to count as found
+MATCH_THRESHOLD = 0.9
+
+# Score a prior-ordered template must reach to stop the search early, well clear of
+# the ~0.91 that neighbouring counts reach against each other
+PRIOR_MARGIN = 0.97
+
+# Smallest template side still worth matching on a downsampled level
+PYRAMID_MIN_TEMPLATE_SIDE = 11
+
+def findImage(template_gray, screenshot_gray):
+    result = cv2.matchTemplate(screenshot_gray, template_gray, cv2.TM_CCOEFF_NORMED)
+    _, max_val, _, max_loc = cv2.minMaxLoc(result)
+    h, w = template_gray.shape
+    top_left = max_loc
+    return top_left[0], top_left[1], w, h, max_val
+
+def matchTemplates(buff_templates, game_screen_gray, offset=(0, 0)):
+    score_list = []
+    match_list = []
+    for template_gray in buff_templates.templates:
+        x, y, w, h, score = findImage(template_gray, game_screen_gray)
+        match_list.append((x + offset[0], y + offset[1], w, h, score))
+        score_list.append(score)
+    if not score_list:
+        return -1, 0.0, match_list
+    max_index, max_value = max(enumerate(score_list), key=lambda x: x[1])
+    return max_index, max_value, match_list
+
+def countFromMatch(buff_templates, max_index, max_value):
+    if max_value > MATCH_THRESHOLD:
+        return buff_templates.counts[max_index]
+    return 0
+
+class TemplatePrior:
+    """Remembers which template matched last so the next tick tries it and its neighbours first.
+
+    Stacks move by one step at a time, so the previous count and the counts
+    right next to it are tried first. The search stops at the first of these
+    scoring at least `margin`; otherwise the remaining templates are swept and
+    the best of all is taken, exactly like matchTemplates.
+    """
+
+    def __init__(self, margin=PRIOR_MARGIN, neighbours=1):
+        self.margin = margin
+        self.neighbours = neighbours
+        self.last_index = None
+        self.template_calls = 0
+        self.early_exits = 0
+        self.sweeps = 0
+
+    def order(self, buff_templates):
+        if self.last_index is None:
+            return []
+        counts = buff_templates.counts
+        steps = sorted(set(counts))
+        position = steps.index(counts[self.last_index])
+        nearby = steps[max(0, position - self.neighbours):position + self.neighbours + 1]
+        candidates = [i for i, count in enumerate(counts) if count in nearby and i != self.last_index]
+        candidates.sort(key=lambda i: abs(counts[i] - counts[self.last_index]))
+        return [self.last_index] + candidates
+
+    def update(self, max_index, max_value):
+        self.last_index = max_index if max_value > MATCH_THRESHOLD else None
+
+def matchTemplatesWithPrior(buff_templates, game_screen_gray, prior, offset=(0, 0)):
+    """matchTemplates that tries the prior's templates first and may return early.
+
+    Templates never evaluated are left as None in the match list.
+    """
+    match_list = [None] * len(buff_templates.templates)
+    for i in prior.order(buff_templates):
+        x, y, w, h, score = findImage(buff_templates.templates[i], game_screen_gray)
+        match_list[i] = (x + offset[0], y + offset[1], w, h, score)
+        prior.template_calls += 1
+        if score >= prior.margin:
+            prior.early_exits += 1
+            return i, score, match_list
+
+    prior.sweeps += 1
+    for i, template_gray in enumerate(buff_templates.templates):
+        if match_list[i] is None:
+            x, y, w, h, score = findImage(template_gray, game_screen_gray)
+            match_list[i] = (x + offset[0], y + offset[1], w, h, score)
+            prior.template_calls += 1
+    if not match_list:
+        return -1, 0.0, match_list
+    max_index = max(range(len(match_list)), key=lambda i: match_list[i][-1])
+    return max_index, match_list[max_index][-1], match_list
+
+class SlotLock:
+    """Remembers where a buff icon was last found so later ticks only search around it.
+
+    The lock is dropped whenever the windowed search falls below the match
+    threshold, and a full scan is forced every `rescan_ticks` ticks so a buff
+    that moved along the bar is picked up again.
+    """
+
+    def __init__(self, padding=8, rescan_ticks=200):
+        self.padding = padding
+        self.rescan_ticks = rescan_ticks
+        self.location = None
+        self.ticks_since_scan = 0
+        self.window_scans = 0
+        self.full_scans = 0
+
+    def searchWindow(self, buff_templates, screen_shape):
+        if self.location is None or self.ticks_since_scan >= self.rescan_ticks:
+            return None
+        x, y, w, h = self.location
+        max_w = max(size[0] for size in buff_templates.sizes)
+        max_h = max(size[1] for size in buff_templates.sizes)
+        x0 = max(0, x - self.padding)
+        y0 = max(0, y - self.padding)
+        x1 = min(screen_shape[1], x + max(w, max_w) + self.padding)
+        y1 = min(screen_shape[0], y + max(h, max_h) + self.padding)
+        if x1 - x0 < max_w or y1 - y0 < max_h:
+            return None
+        return x0, y0, x1, y1
+
+    def lock(self, match):
+        self.location = match[:4]
+
+    def unlock(self):
+        self.location = None
+
+def pyramidDepth(template_bank, min_side=PYRAMID_MIN_TEMPLATE_SIDE):
+    """Number of pyDown levels that keep the smallest template at least `min_side` pixels wide."""
+    sides = [min(size) for buff_templates in template_bank for size in buff_templates.sizes]
+    if not sides:
+        return 0
+    side = min(sides)
+    depth = 0
+    while (side >> (depth + 1)) >= min_side:
+        depth += 1
+    return depth
+
+def downsample(image, depth):
+    for _ in range(depth):
+        image = cv2.pyrDown(image)
+    return image
+
+class PyramidMatcher:
+    """Coarse-to-fine full scans: rank templates on a downsampled ROI, refine the best at full size.
+
+    Every template is matched against the ROI shrunk by 2**depth, then only the
+    `candidates` best scoring templates are matched again at full resolution in a
+    small window around their coarse hit. Only refined scores are ever returned.
+    """
+
+    def __init__(self, template_bank, candidates=3, depth=None):
+        self.depth = pyramidDepth(template_bank) if depth is None else depth
+        self.candidates = candidates
+        self.coarse_templates = {
+            buff_templates.name: tuple(downsample(template, self.depth) for template in buff_templates.templates)
+            for buff_templates in template_bank
+        }
+
+    def forFrame(self, game_screen_gray):
+        """Returns a full-scan function shared by every buff, the frame is downsampled once when a buff first needs it."""
+        if self.depth == 0:
+            return matchTemplates
+        coarse = []
+
+        def fullScan(buff_templates, game_screen_gray):
+            # Ticks where every buff stays inside its slot lock never pay for the downsample
+            if not coarse:
+                coarse.append(downsample(game_screen_gray, self.depth))
+            return self.matchTemplates(buff_templates, game_screen_gray, coarse[0])
+        return fullScan
+
+    def matchTemplates(self, buff_templates, game_screen_gray, coarse_screen_gray):
+        coarse_templates = self.coarse_templates[buff_templates.name]
+        if not coarse_templates:
+            return -1, 0.0, []
+        factor = 1 << self.depth
+        match_list = []
+        for template_gray, coarse_template in zip(buff_templates.templates, coarse_templates):
+            x, y, _, _, score = findImage(coarse_template, coarse_screen_gray)
+            h, w = template_gray.shape
+            match_list.append((x * factor, y * factor, w, h, score))
+
+        ranked = sorted(range(len(match_list)), key=lambda i: match_list[i][-1], reverse=True)
+        max_index, max_value = -1, -1.0
+        for i in ranked[:self.candidates]:
+            x, y, w, h, _ = match_list[i]
+            x0 = max(0, x - factor)
+            y0 = max(0, y - factor)
+            x1 = min(game_screen_gray.shape[1], x + w + factor)
+            y1 = min(game_screen_gray.shape[0], y + h + factor)
+            rx, ry, _, _, score = findImage(buff_templates.templates[i], game_screen_gray[y0:y1, x0:x1])
+            match_list[i] = (rx + x0, ry + y0, w, h, score)
+            if score > max_value:
+                max_index, max_value = i, score
+        return max_index, max_value, match_list
+
+def boxSums(integral, w, h):
+    """Sum of every w x h patch from a cv2 integral image, one value per matchTemplate position."""
+    return integral[h:, w:] - integral[:-h, w:] - integral[h:, :-w] + integral[:-h, :-w]
+
+class FFTFrame:
+    """One ROI's spectrum and patch statistics, computed on first use and shared by every buff."""
+
+    def __init__(self, game_screen_gray, fft_shape):
+        self.game_screen_gray = game_screen_gray
+        self.fft_shape = fft_shape
+        self.lock = threading.Lock()
+        self.spectrum = None
+        self.patch_norms = {}
+
+    def prepare(self):
+        with self.lock:
+            if self.spectrum is None:
+                self.integral, self.integral_sq = cv2.integral2(self.game_screen_gray, sdepth=cv2.CV_64F)
+                self.spectrum = np.fft.rfft2(self.game_screen_gray.astype(np.float32), s=self.fft_shape)
+
+    def inversePatchNorm(self, w, h):
+        # 1 / sqrt of each patch's summed squared deviation from its mean, the ROI half of the denominator
+        inverse_norm = self.patch_norms.get((w, h))
+        if inverse_norm is None:
+            sums = boxSums(self.integral, w, h)
+            patch_norm = np.sqrt(np.maximum(boxSums(self.integral_sq, w, h) - sums * sums / (w * h), 0)).astype(np.float32)
+            # Flat patches have no correlation to speak of, cv2 scores them 0 too
+            inverse_norm = np.divide(1, patch_norm, out=np.zeros_like(patch_norm), where=patch_norm > 0.5 * np.sqrt(w * h))
+            self.patch_norms[(w, h)] = inverse_norm
+        return inverse_norm
+
+class FFTMatcher:
+    """Full scans as one batched FFT correlation of the ROI against all of a buff's templates.
+
+    The ROI is transformed once per tick and shared by all buffs, the
+    templates' spectra are built once per ROI size. Zero-mean templates and
+    integral-image patch sums turn the correlation into the same
+    TM_CCOEFF_NORMED scores cv2.matchTemplate gives, to float precision.
+    """
+
+    def __init__(self, template_bank):
+        self.template_bank = template_bank
+        self.lock = threading.Lock()
+        self.roi_shape = None
+        self.fft_shape = None
+        self.spectra = {}
+
+    def templateSpectra(self, roi_shape):
+        with self.lock:
+            if roi_shape != self.roi_shape:
+                fft_shape = (cv2.getOptimalDFTSize(roi_shape[0]), cv2.getOptimalDFTSize(roi_shape[1]))
+                spectra = {}
+                for buff_templates in self.template_bank:
+                    if not buff_templates.templates:
+                        continue
+                    stack = np.zeros((len(buff_templates.templates),) + fft_shape, dtype=np.float32)
+                    norms = np.zeros(len(buff_templates.templates))
+                    for i, template_gray in enumerate(buff_templates.templates):
+                        h, w = template_gray.shape
+                        if h > roi_shape[0] or w > roi_shape[1]:
+                            continue
+                        zero_mean = template_gray - np.float32(template_gray.mean())
+                        stack[i, :h, :w] = zero_mean
+                        norms[i] = np.sqrt((zero_mean * zero_mean).sum())
+                    # Conjugate so a product with the ROI spectrum is a correlation, not a convolution
+                    # Single precision halves the FFT cost and keeps scores within ~1e-5 of cv2
+                    spectra[buff_templates.name] = (np.conj(np.fft.rfft2(stack)), norms)
+                self.roi_shape, self.fft_shape, self.spectra = roi_shape, fft_shape, spectra
+            return self.spectra
+
+    def forFrame(self, game_screen_gray):
+        """Returns a full-scan function that transforms the frame at most once for every buff."""
+        self.templateSpectra(game_screen_gray.shape)
+        return partial(self.matchTemplates, fft_frame=FFTFrame(game_screen_gray, self.fft_shape))
+
+    def matchTemplates(self, buff_templates, game_screen_gray, fft_frame):
+        if buff_templates.name not in self.spectra:
+            return -1, 0.0, []
+        template_spectra, norms = self.spectra[buff_templates.name]
+        fft_frame.prepare()
+        correlations = np.fft.irfft2(fft_frame.spectrum * template_spectra, s=self.fft_shape)
+        roi_h, roi_w = game_screen_gray.shape
+        match_list = []
+        for i, (w, h) in enumerate(buff_templates.sizes):
+            if not norms[i]:
+                match_list.append((0, 0, w, h, 0.0))
+                continue
+            # The template's own norm is a constant, so it only has to divide the best position
+            scores = correlations[i, :roi_h - h + 1, :roi_w - w + 1] * fft_frame.inversePatchNorm(w, h)
+            y, x = np.unravel_index(np.argmax(scores), scores.shape)
+            match_list.append((int(x), int(y), w, h, float(scores[y, x]) / norms[i]))
+        max_index = max(range(len(match_list)), key=lambda i: match_list[i][-1])
+        return max_index, match_list[max_index][-1], match_list
+
+def matchBuff(buff_templates, game_screen_gray, slot_lock=None, full_scan=matchTemplates, prior=None):
+    """Matches one buff, searching only the locked window when `slot_lock` has a position.
+
+    With a `prior`, exhaustive scans try the last matched template's neighbours first.
+    """
+    if not buff_templates.templates:
+        return -1, 0.0, []
+    scan = matchTemplates if prior is None else partial(matchTemplatesWithPrior, prior=prior)
+    if slot_lock is not None:
+        window = slot_lock.searchWindow(buff_templates, game_screen_gray.shape)
+        if window is not None:
+            x0, y0, x1, y1 = window
+            slot_lock.ticks_since_scan += 1
+            slot_lock.window_scans += 1
+            max_index, max_value, match_list = scan(buff_templates, game_screen_gray[y0:y1, x0:x1], offset=(x0, y0))
+            if max_value > MATCH_THRESHOLD:
+                slot_lock.lock(match_list[max_index])
+                if prior is not None:
+                    prior.update(max_index, max_value)
+                return max_index, max_value, match_list
+
+    if full_scan is matchTemplates:
+        full_scan = scan
+    max_index, max_value, match_list = full_scan(buff_templates, game_screen_gray)
+    if slot_lock is not None:
+        slot_lock.ticks_since_scan = 0
+        slot_lock.full_scans += 1
+        if max_value > MATCH_THRESHOLD:
+            slot_lock.lock(match_list[max_index])
+        else:
+            slot_lock.unlock()
+    if prior is not None:
+        prior.update(max_index, max_value)
+    return max_index, max_value, match_list
+
+def compareFullScan(template_bank, frames_gray, matcher):
+    """Runs the exhaustive full scan and `matcher`'s over the same frames and reports agreement and speedup."""
+    mismatches = 0
+    max_score_error = 0.0
+    exhaustive_time = 0.0
+    matcher_time = 0.0
+    for game_screen_gray in frames_gray:
+        start_time = time.perf_counter()
+        expected = [matchTemplates(b, game_screen_gray)[:2] for b in template_bank]
+        exhaustive_time += time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        full_scan = matcher.forFrame(game_screen_gray)
+        actual = [full_scan(b, game_screen_gray)[:2] for b in template_bank]
+        matcher_time += time.perf_counter() - start_time
+
+        if [countFromMatch(b, *match) for b, match in zip(template_bank, actual)] != [countFromMatch(b, *match) for b, match in zip(template_bank, expected)]:
+            mismatches += 1
+        max_score_error = max([max_score_error] + [abs(a[1] - e[1]) for a, e in zip(actual, expected)])
+    return {
+        'frames': len(frames_gray),
+        'mismatches': mismatches,
+        'max_score_error': max_score_error,
+        'exhaustive_ms': exhaustive_time * 1000 / max(1, len(frames_gray)),
+        'matcher_ms': matcher_time * 1000 / max(1, len(frames_gray)),
+        'speedup': exhaustive_time / matcher_time if matcher_time else 0.0,
+    }
+
+if __name__ == '__main__':
+    # Usage: python buff_matching.py <asset_path_prefix> <recorded_frames_dir>
+    from buff_registry import BUFFS
+    from template_bank import loadTemplateBank
+    from screen_capture import ReplayCaptureBackend
+    from detector import toGray
+
+    template_bank = loadTemplateBank(sys.argv[1], list(BUFFS))
+    replay = ReplayCaptureBackend(sys.argv[2], loop=False)
+    replay.open()
+    frames_gray = [toGray(frame) for frame in replay.frames]
+    for name, matcher in (('pyramid', PyramidMatcher(template_bank)), ('fft', FFTMatcher(template_bank))):
+        print(f"{name}:")
+        for key, value in compareFullScan(template_bank, frames_gray, matcher).items():
+            print(f"    {key}: {value:.3f}" if isinstance(value, float) else f"    {key}: {value}")
@@ -0,0 +1,70 @@
+import os
+
+class Buff:
+    """One stack buff, declared once: how to find it, count it, draw it and alert on it.
+
+    `templates` pairs template file names (without .png, looked up in the
+    asset set folder) with the stack count each shows, in matching order.
+    `render_layers` does the same for the gauge layers in
+    assets/modular_render_assets, starting with the empty state 0; a buff
+    without them is detected, logged and streamed but not drawn. `step` is
+    how far apart consecutive counts are, `alert` the default alert
+    settings (see `alerts` in config.json) or None.
+    """
+
+    __slots__ = ('name', 'label', 'templates', 'render_layers', 'step', 'max_stacks', 'alert')
+
+    def __init__(self, name, label, templates, render_layers=(), step=1, max_stacks=None, alert=None):
+        self.name = name
+        self.label = label
+        self.templates = list(templates)
+        self.render_layers = list(render_layers)
+        self.step = step
+        self.max_stacks = max_stacks if max_stacks is not None else max(count for _, count in self.templates)
+        self.alert = alert
+
+    @classmethod
+    def fromConfig(cls, name, entry):
+        """A buff from an entry of config.json's `buffs`, where templates and layers map file names to counts."""
+        return cls(
+            name,
+            entry.get('label', name.replace('_', ' ').title()),
+            entry['templates'].items(),
+            entry.get('render_layers', {}).items(),
+            entry.get('step', 1),
+            entry.get('max_stacks'),
+            entry.get('alert'),
+        )
+
+# Every known buff by name. The order is the gauge's bottom-to-top drawing order and the column order of batch results
+BUFFS = {buff.name: buff for buff in (
+    Buff(
+        'souls', 'Soul Stacks',
+        templates=[(f'soul_{i}{suffix}', i) for i in range(1, 6) for suffix in ('', '_alt')],
+        render_layers=[(f's{i}', i) for i in range(0, 6)],
+        step=1,
+        alert={'threshold': 5, 'sound': os.path.join('assets', 'soul_alert.wav'), 'cooldown': 0},
+    ),
+    Buff(
+        'necrosis', 'Necrosis Stacks',
+        templates=[(f'necrosis_{i}', i) for i in [2, 4, 6, 8, 10, 12]],
+        render_layers=[(f'n{i}', i) for i in [0, 2, 4, 6, 8, 10, 12]],
+        step=2,
+        alert={'threshold': 12, 'sound': os.path.join('assets', 'necrosis_alert.wav'), 'cooldown': 0},
+    ),
+    Buff(
+        'deathsparks', 'Death Spark Stacks',
+        templates=[(f'deathspark_{i}', i) for i in range(1, 6)],
+        render_layers=[(f'ds{i}', i) for i in range(0, 6)],
+        step=1,
+    ),
+)}
+
+def registerBuffs(config):
+    """Adds the buffs declared under config.json's `buffs`, an entry named like a built-in buff replaces it."""
+    for name, entry in config.get('buffs', {}).items():
+        BUFFS[name] = Buff.fromConfig(name, entry)
+
+def trackedBuffs(config):
+    """Names of the buffs `config` tracks, every buff is tracked unless its track_<name> is false."""
+    return [name for name in BUFFS if config.get(f'track_{name}', True)]
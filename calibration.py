@@ -0,0 +1,177 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import cv2
+
+from buff_registry import BUFFS, registerBuffs, trackedBuffs
+from template_bank import availableAssetSets, loadTemplateBank
+from buff_matching import MATCH_THRESHOLD, downsample, findImage
+from detector import toGray
+
+# Deepest pyramid level searched, a 4K screen is 480x270 there
+MAX_SEARCH_DEPTH = 3
+# Smallest template side on the coarse level, below the detector's since several peaks get refined
+MIN_SEARCH_SIDE = 6
+# Coarse peaks refined at full size per template
+SEARCH_PEAKS = 5
+
+class BuffHit:
+    """Where one buff icon was found on the screen and which asset set's template found it."""
+
+    __slots__ = ('buff', 'count', 'x', 'y', 'w', 'h', 'score')
+
+    def __init__(self, buff, count, x, y, w, h, score):
+        self.buff = buff
+        self.count = count
+        self.x = x
+        self.y = y
+        self.w = w
+        self.h = h
+        self.score = score
+
+class Calibration:
+    """Best asset set for the screen, the ROI around its buff icons and the icons themselves."""
+
+    def __init__(self, asset_set, roi, hits, elapsed_ms):
+        self.asset_set = asset_set
+        self.roi = roi
+        self.hits = hits
+        self.elapsed_ms = elapsed_ms
+
+    def configValues(self):
+        resolution, windows_scaling, buffbar_size = self.asset_set.split('/')
+        return {'main_roi': self.roi, 'resolution': resolution, 'windows_scaling': windows_scaling, 'buffbar_size': buffbar_size}
+
+def templateDigest(template_gray):
+    return hashlib.sha1(template_gray.tobytes() + str(template_gray.shape).encode()).digest()
+
+def searchDepth(template_gray):
+    side = min(template_gray.shape)
+    depth = 0
+    while depth < MAX_SEARCH_DEPTH and (side >> (depth + 1)) >= MIN_SEARCH_SIDE:
+        depth += 1
+    return depth
+
+def locateTemplate(template_gray, screen_levels):
+    """Finds a template on the full screen: the best peaks on the coarsest usable level, refined at full size."""
+    depth = searchDepth(template_gray)
+    factor = 1 << depth
+    h, w = template_gray.shape
+    result = cv2.matchTemplate(screen_levels[depth], downsample(template_gray, depth), cv2.TM_CCOEFF_NORMED)
+    best = (0, 0, w, h, -1.0)
+    for _ in range(SEARCH_PEAKS):
+        _, _, _, (x, y) = cv2.minMaxLoc(result)
+        # Blank out the peak so the next pass finds the runner-up elsewhere
+        result[max(0, y - 2):y + 3, max(0, x - 2):x + 3] = -1
+        x0 = max(0, x * factor - factor)
+        y0 = max(0, y * factor - factor)
+        x1 = min(screen_levels[0].shape[1], x * factor + w + factor)
+        y1 = min(screen_levels[0].shape[0], y * factor + h + factor)
+        rx, ry, _, _, score = findImage(template_gray, screen_levels[0][y0:y1, x0:x1])
+        if score > best[4]:
+            best = (rx + x0, ry + y0, w, h, score)
+    return best
+
+def calibrate(screen, base_path, tracked_buffs=None, padding=None, screen_offset=(0, 0)):
+    """Searches a full-screen grab for the buff icons of every asset set under assets/reso_*.
+
+    Each asset set is one candidate UI scale. The set that finds the most
+    tracked buffs wins, ties go to the set made for the screen's resolution
+    and then to the higher mean score. The ROI is the box around the found
+    icons, padded by `padding` (x, y) pixels, two icon widths and half an
+    icon height by default, so icons of other counts and small shifts along
+    the bar still fit. Returns None when no buff icon is visible.
+    """
+    start_time = time.perf_counter()
+    tracked_buffs = tracked_buffs or list(BUFFS)
+    screen_gray = toGray(screen)
+    screen_levels = [screen_gray]
+    for _ in range(MAX_SEARCH_DEPTH):
+        screen_levels.append(cv2.pyrDown(screen_levels[-1]))
+
+    # Many sets share identical templates, each distinct one is searched once
+    banks = {asset_set: loadTemplateBank(os.path.join(base_path, 'assets', *asset_set.split('/')), tracked_buffs) for asset_set in availableAssetSets(base_path)}
+    located = {}
+    for bank in banks.values():
+        for buff_templates in bank:
+            for template_gray in buff_templates.templates:
+                key = templateDigest(template_gray)
+                if key not in located:
+                    located[key] = locateTemplate(template_gray, screen_levels)
+
+    screen_resolution = f'reso_{screen_gray.shape[1]}x{screen_gray.shape[0]}'
+    best = None
+    for asset_set, bank in banks.items():
+        hits = []
+        for buff_templates in bank:
+            best_hit = None
+            for template_gray, count in zip(buff_templates.templates, buff_templates.counts):
+                x, y, w, h, score = located[templateDigest(template_gray)]
+                if score > MATCH_THRESHOLD and (best_hit is None or score > best_hit.score):
+                    best_hit = BuffHit(buff_templates.name, count, x, y, w, h, score)
+            if best_hit is not None:
+                hits.append(best_hit)
+        if not hits:
+            continue
+        rank = (len(hits), asset_set.startswith(screen_resolution + '/'), sum(hit.score for hit in hits) / len(hits))
+        if best is None or rank > best[0]:
+            best = (rank, asset_set, hits)
+    if best is None:
+        return None
+
+    _, asset_set, hits = best
+    icon_w = max(size[0] for buff_templates in banks[asset_set] for size in buff_templates.sizes)
+    icon_h = max(size[1] for buff_templates in banks[asset_set] for size in buff_templates.sizes)
+    pad_x, pad_y = padding if padding is not None else (2 * icon_w, icon_h // 2)
+    x0 = max(0, min(hit.x for hit in hits) - pad_x)
+    y0 = max(0, min(hit.y for hit in hits) - pad_y)
+    x1 = min(screen_gray.shape[1], max(hit.x + icon_w for hit in hits) + pad_x)
+    y1 = min(screen_gray.shape[0], max(hit.y + icon_h for hit in hits) + pad_y)
+    roi = {'left': x0 + screen_offset[0], 'top': y0 + screen_offset[1], 'width': x1 - x0, 'height': y1 - y0}
+    return Calibration(asset_set, roi, hits, (time.perf_counter() - start_time) * 1000)
+
+def calibrateScreen(base_path, tracked_buffs=None, padding=None):
+    """Grabs the primary monitor once and calibrates against it."""
+    from screen_capture import grabScreenshot, primaryMonitorROI
+    monitor = primaryMonitorROI()
+    return calibrate(grabScreenshot(monitor), base_path, tracked_buffs, padding, (monitor['left'], monitor['top']))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Finds the buff bar and the matching asset set on a screenshot or the live screen.')
+    parser.add_argument('screenshot', nargs='?', help='Full-screen screenshot to calibrate on. The primary monitor is grabbed when left out.')
+    parser.add_argument('--write', action='store_true', help='Save the ROI and asset set to config.json.')
+    parser.add_argument('--padding', type=int, nargs=2, metavar=('X', 'Y'), help='Pixels added around the found icons.')
+    args = parser.parse_args()
+
+    config = {}
+    if os.path.exists('config.json'):
+        with open('config.json', 'r') as f:
+            config = json.load(f)
+    registerBuffs(config)
+    tracked_buffs = trackedBuffs(config)
+    base_path = os.path.abspath('.')
+    if args.screenshot:
+        screenshot = cv2.imread(args.screenshot, cv2.IMREAD_UNCHANGED)
+        if screenshot is None:
+            parser.error(f'could not read {args.screenshot}')
+        calibration = calibrate(screenshot, base_path, tracked_buffs, args.padding)
+    else:
+        calibration = calibrateScreen(base_path, tracked_buffs, args.padding)
+
+    if calibration is None:
+        print("No buff icons found, make sure souls, necrosis or deathsparks are on the buff bar")
+    else:
+        for hit in calibration.hits:
+            print(f"{hit.buff}: {hit.count} stacks at ({hit.x}, {hit.y}), score {hit.score:.3f}")
+        missing = [name for name in tracked_buffs if name not in {hit.buff for hit in calibration.hits}]
+        if missing:
+            print(f"Not on screen, the ROI may not cover them: {', '.join(missing)}")
+        print(f"Asset set {calibration.asset_set}, ROI {calibration.roi}, in {calibration.elapsed_ms:.0f} ms")
+        if args.write:
+            config.update(calibration.configValues())
+            with open('config.json', 'w') as f:
+                json.dump(config, f)
+            print("Saved to config.json")
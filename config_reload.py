@@ -0,0 +1,83 @@
+import json
+import os
+
+# Which part of the running overlay each config.json key feeds, keys missing here only apply on the next launch
+RELOAD_TARGETS = {
+    'main_roi': ('roi',),
+    'image_position': ('position',),
+    'compact_overlay': ('position',),
+    'scale': ('render',),
+    'render_cache_budget_mb': ('render',),
+    'update_rate': ('scheduler',),
+    'fast_update_rate': ('scheduler',),
+    'idle_update_rate': ('scheduler',),
+    'idle_after': ('scheduler',),
+    'adaptive_update_rate': ('scheduler',),
+    'alerts': ('alerts', 'scheduler'),
+    'audio_driver': ('alerts',),
+    'resolution': ('detector',),
+    'windows_scaling': ('detector',),
+    'buffbar_size': ('detector',),
+    'match_mode': ('detector',),
+    'pyramid_candidates': ('detector',),
+    'slot_lock': ('detector',),
+    'slot_lock_padding': ('detector',),
+    'slot_lock_rescan_ticks': ('detector',),
+    'template_prior': ('detector',),
+    'prior_margin': ('detector',),
+    'skip_unchanged_frames': ('detector',),
+    'change_tolerance': ('detector',),
+    'change_max_skipped_ticks': ('detector',),
+    'capture_source': ('capture',),
+    'metrics_log': ('metrics',),
+    'metrics_log_interval': ('metrics',),
+}
+# What a track_<buff> key feeds, for built-in buffs and those declared under `buffs` alike
+TRACK_TARGETS = ('detector', 'render', 'alerts', 'scheduler')
+
+def configChanges(old, new):
+    """Parts of the running overlay to rebuild for `new`, and the changed keys that need a restart."""
+    targets = set()
+    restart_keys = []
+    for key in sorted(set(old) | set(new)):
+        if old.get(key) == new.get(key):
+            continue
+        if key in RELOAD_TARGETS:
+            targets.update(RELOAD_TARGETS[key])
+        elif key.startswith('track_'):
+            targets.update(TRACK_TARGETS)
+        else:
+            restart_keys.append(key)
+    return targets, restart_keys
+
+class ConfigWatcher:
+    """Notices edits to config.json by polling its modification time and size.
+
+    Editors often replace the file rather than writing into it, which a
+    poll survives. A file that does not parse, e.g. while it is half
+    saved, is skipped until the next change.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.signature = self.fileSignature()
+
+    def fileSignature(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def poll(self):
+        """The new config when the file changed since the last poll, otherwise None."""
+        signature = self.fileSignature()
+        if signature is None or signature == self.signature:
+            return None
+        self.signature = signature
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring config.json edit: {e}")
+            return None
@@ -0,0 +1,133 @@
+import threading
+import time
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from buff_registry import BUFFS
+from pipeline_stats import PipelineStats
+
+class DetectionWorker(QThread):
+    """Runs capture and detection off the GUI thread.
+
+    The worker owns the capture backend and the detector. Each tick matches
+    every buff in one detect call, run as a single task on `executor` when
+    given (a pool shared with the workers of other profiles, so they never
+    use more threads than cores) and on the worker thread otherwise. Ticks
+    are paced by a TickScheduler. The GUI only hears about a tick through
+    `countsChanged` (a dict of counts by buff name), and only when
+    a count actually changed, as does `publisher` (an EventStream) when set.
+    `session_log` (a SessionLog) keeps the counts timeline for later review.
+    `reconfigure` swaps parts in between ticks without stopping the thread.
+    """
+
+    countsChanged = pyqtSignal(dict)
+    # Emitted once, after the first frame has been captured and matched
+    firstDetection = pyqtSignal()
+
+    def __init__(self, capture, detector, scheduler, recorder=None, stats=None, publisher=None, session_log=None, executor=None, profile=None):
+        super().__init__()
+        self.capture = capture
+        self.detector = detector
+        self.scheduler = scheduler
+        self.recorder = recorder
+        self.publisher = publisher
+        self.session_log = session_log
+        self.profile = profile
+        self.stats = stats if stats is not None else PipelineStats()
+
+        self.counts = {name: 0 for name in BUFFS}
+        self.stop_event = threading.Event()
+        # Set to cut the wait before the next tick short, on stop or reconfiguration
+        self.wake_event = threading.Event()
+        self.pending = {}
+        self.pending_lock = threading.Lock()
+        self.executor = executor
+
+    def run(self):
+        # The capture session is opened here so it belongs to the worker thread
+        self.capture.open()
+        try:
+            self.scheduler.start()
+            while not self.stop_event.is_set():
+                self.applyPending()
+                self.updateStacks()
+                if self.scheduler.ticks == 0:
+                    self.firstDetection.emit()
+                self.wake_event.wait(self.scheduler.nextDelay())
+                self.wake_event.clear()
+        finally:
+            self.capture.close()
+            if self.recorder is not None:
+                self.recorder.close()
+
+    def stop(self):
+        self.stop_event.set()
+        self.wake_event.set()
+
+    def reconfigure(self, capture=None, detector=None, roi=None, rates=None):
+        """Queues a new capture backend, detector, ROI or scheduler rates, swapped in by the worker before its next tick.
+
+        Safe to call from any thread. `rates` are TickScheduler.setRates keyword arguments.
+        """
+        with self.pending_lock:
+            for key, value in (('capture', capture), ('detector', detector), ('roi', roi), ('rates', rates)):
+                if value is not None:
+                    self.pending[key] = value
+        self.wake_event.set()
+
+    def applyPending(self):
+        with self.pending_lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return
+        try:
+            if 'capture' in pending:
+                self.capture.close()
+                self.capture = pending['capture']
+                self.capture.open()
+            if 'detector' in pending:
+                # Counts, slot locks and priors carry over so the swap costs no extra full scans
+                pending['detector'].inheritState(self.detector)
+                self.detector = pending['detector']
+            if 'roi' in pending:
+                roi = pending['roi']
+                self.detector.shiftROI(roi['left'] - self.capture.roi['left'], roi['top'] - self.capture.roi['top'])
+                # A resized ROI's frames go to a new recording, one recording holds frames of one size
+                if self.recorder is not None and (roi['width'], roi['height']) != (self.capture.roi['width'], self.capture.roi['height']):
+                    self.recorder.nextSegment(roi)
+                self.capture.setROI(roi)
+            if 'rates' in pending:
+                self.scheduler.setRates(**pending['rates'])
+        except Exception as e:
+            print(f"An error occurred: {e}")
+
+    def updateStacks(self):
+        try:
+            start_time = time.perf_counter()
+            capture_time = time.time()
+            game_screen = self.capture.grab()
+            self.stats.record('capture', self.capture.last_grab_ms)
+            if self.recorder is not None:
+                # A failing recorder must not cost the tick its detection
+                try:
+                    self.recorder.append(game_screen)
+                except Exception as e:
+                    print(f"An error occurred: {e}")
+
+            if self.executor is not None:
+                detection = self.executor.submit(self.detector.detect, game_screen, self.stats).result()
+            else:
+                detection = self.detector.detect(game_screen, self.stats)
+            self.stats.record('tick', (time.perf_counter() - start_time) * 1000)
+            self.scheduler.observe(detection.counts)
+            changed = detection.counts != self.counts
+            # Subscribers get changes straight from this thread without waiting on the GUI, and the first tick's counts as a baseline
+            if self.publisher is not None and (changed or self.scheduler.ticks == 0):
+                self.publisher.publish(detection.counts, detection.confidences, capture_time, self.profile)
+            if self.session_log is not None:
+                self.session_log.record(detection.counts, detection.confidences, capture_time)
+            if changed:
+                self.counts = detection.counts
+                self.countsChanged.emit(self.counts)
+        except Exception as e:
+            print(f"An error occurred: {e}")
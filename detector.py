@@ -0,0 +1,312 @@
+import time
+
+import cv2
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+from buff_registry import BUFFS, trackedBuffs
+from template_bank import loadTemplateBank
+from buff_matching import FFTMatcher, PyramidMatcher, SlotLock, TemplatePrior, MATCH_THRESHOLD, PRIOR_MARGIN, downsample, findImage, matchBuff, matchTemplates, countFromMatch
+from frame_change import FrameChangeDetector
+
+# Most frames scanned in full together by detectBatch, the group doubles up to this while a buff stays absent
+FULL_SCAN_BATCH = 64
+
+class Detection:
+    """Stack counts and best match scores of one frame, `matched` is False when the frame was skipped as unchanged."""
+
+    __slots__ = ('counts', 'confidences', 'matched')
+
+    def __init__(self, counts, confidences, matched=True):
+        self.counts = counts
+        self.confidences = confidences
+        self.matched = matched
+
+def toGray(frame):
+    if frame.ndim == 2:
+        return frame
+    if frame.shape[2] == 4:
+        return cv2.cvtColor(frame, cv2.COLOR_BGRA2GRAY)
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+class NecroDetector:
+    """Finds the stacks of every registered buff in buff bar frames, with no GUI involved.
+
+    `detect` handles one live frame at a time and keeps state between calls
+    (slot locks, the unchanged-frame check). `detectBatch` is stateless and
+    matches whole stacks of recorded frames at once.
+
+    Reads the same keys as config.json: track_*, slot_lock*, template_prior,
+    prior_margin, match_mode, pyramid_candidates, skip_unchanged_frames and
+    change_*. Buffs come from buff_registry, so `buffs` must be registered
+    before a detector is built.
+    """
+
+    def __init__(self, config, asset_path_prefix, executor=None, packed_templates=None, template_bank=None):
+        self.tracked_buffs = trackedBuffs(config)
+        self.buff_names = list(BUFFS)
+        # Templates are decoded and converted to grayscale once, matching only reads from the bank.
+        # A bank is frozen, so detectors of the same asset set can be handed the same one
+        if template_bank is None:
+            template_bank = loadTemplateBank(asset_path_prefix, self.tracked_buffs, packed_templates)
+        self.template_bank = template_bank
+        self.executor = executor
+
+        # Buff icons rarely move, so after a full scan each buff is only searched around its last position
+        if config.get('slot_lock', True):
+            self.slot_locks = {name: SlotLock(config.get('slot_lock_padding', 8), config.get('slot_lock_rescan_ticks', 200)) for name in self.tracked_buffs}
+        else:
+            self.slot_locks = {}
+
+        # Counts move in small steps, so the last count's templates are tried first and usually end the search
+        if config.get('template_prior', True):
+            self.priors = {name: TemplatePrior(config.get('prior_margin', PRIOR_MARGIN)) for name in self.tracked_buffs}
+        else:
+            self.priors = {}
+
+        # 'pyramid' ranks templates on a downsampled ROI and only refines the best at full size,
+        # 'fft' correlates the ROI with all templates at once in the frequency domain
+        match_mode = config.get('match_mode', 'exhaustive')
+        self.pyramid_candidates = config.get('pyramid_candidates', 3)
+        if match_mode == 'pyramid':
+            self.full_scan_matcher = PyramidMatcher(self.template_bank, self.pyramid_candidates)
+        elif match_mode == 'fft':
+            self.full_scan_matcher = FFTMatcher(self.template_bank)
+        else:
+            self.full_scan_matcher = None
+        # detectBatch always scans coarse-to-fine, with a pyramid built on first use outside pyramid mode
+        self.batch_matcher = None
+
+        if config.get('skip_unchanged_frames', True):
+            self.change_detector = FrameChangeDetector(tolerance=config.get('change_tolerance', 6), max_skipped_ticks=config.get('change_max_skipped_ticks', 20))
+        else:
+            self.change_detector = None
+
+        self.last_detection = Detection({name: 0 for name in self.buff_names}, {name: 0.0 for name in self.buff_names}, matched=False)
+
+    def shiftROI(self, dx, dy):
+        """Keeps slot locks on their icons after the ROI's top-left corner moved by (dx, dy) screen pixels."""
+        for lock in self.slot_locks.values():
+            if lock.location is not None:
+                x, y, w, h = lock.location
+                if x - dx < 0 or y - dy < 0:
+                    lock.unlock()
+                else:
+                    lock.location = (x - dx, y - dy, w, h)
+        if self.change_detector is not None:
+            self.change_detector.reset()
+
+    def inheritState(self, previous):
+        """Takes over the last counts, and the slot locks and priors of buffs whose templates did not change, from the detector this one replaces."""
+        self.last_detection = previous.last_detection
+        for name in self.tracked_buffs:
+            if name not in previous.template_bank:
+                continue
+            old_templates, new_templates = previous.template_bank[name], self.template_bank[name]
+            if old_templates.counts != new_templates.counts or old_templates.sizes != new_templates.sizes:
+                continue
+            if name in self.slot_locks and name in previous.slot_locks:
+                self.slot_locks[name].location = previous.slot_locks[name].location
+            if name in self.priors and name in previous.priors:
+                self.priors[name].last_index = previous.priors[name].last_index
+
+    def lockedRegions(self):
+        # Icon regions are only enough to spot changes when every tracked buff is locked
+        if not self.slot_locks or any(lock.location is None for lock in self.slot_locks.values()):
+            return None
+        return [lock.location for lock in self.slot_locks.values()]
+
+    def detect(self, frame, timings=None):
+        """Detects the stacks in one BGRA, BGR or grayscale frame.
+
+        When `timings` is given (a dict of lists or a PipelineStats), the
+        milliseconds spent in each stage are appended under 'gray', 'change'
+        and each buff name.
+        """
+        start_time = time.perf_counter()
+        # Convert once per frame, every matcher shares the same grayscale frame
+        game_screen_gray = toGray(frame)
+        gray_time = time.perf_counter()
+        if timings is not None:
+            timings.setdefault('gray', []).append((gray_time - start_time) * 1000)
+
+        # An unchanged buff bar keeps the previous counts without matching anything
+        if self.change_detector is not None:
+            changed = self.change_detector.hasChanged(game_screen_gray, self.lockedRegions())
+            if timings is not None:
+                timings.setdefault('change', []).append((time.perf_counter() - gray_time) * 1000)
+            if not changed:
+                return Detection(self.last_detection.counts, self.last_detection.confidences, matched=False)
+
+        # One pass over the frame for every buff: each only adds its own templates' matching,
+        # and the full-scan preprocessing (pyramid or spectrum) is shared and only done when needed
+        full_scan = self.full_scan_matcher.forFrame(game_screen_gray) if self.full_scan_matcher is not None else matchTemplates
+        counts = {name: 0 for name in self.buff_names}
+        confidences = {name: 0.0 for name in self.buff_names}
+        for buff_templates in self.template_bank:
+            name = buff_templates.name
+            match_start = time.perf_counter()
+            max_index, max_value, _ = matchBuff(buff_templates, game_screen_gray, self.slot_locks.get(name), full_scan, self.priors.get(name))
+            counts[name] = countFromMatch(buff_templates, max_index, max_value)
+            confidences[name] = float(max_value)
+            if timings is not None:
+                timings.setdefault(name, []).append((time.perf_counter() - match_start) * 1000)
+        self.last_detection = Detection(counts, confidences)
+        return self.last_detection
+
+    def detectBatch(self, frames, batch_size=256):
+        """Detects the stacks of every frame in an (N, H, W[, C]) stack, e.g. a recording's memmap.
+
+        Frames identical to the one before reuse its result. For each buff,
+        frames are scanned in full until the icon is found. Then the padded
+        window around it is cut from all remaining frames and matched as one
+        tall image, one matchTemplate call per template. Frames where the
+        window comes up empty are scanned in full again, which also finds a
+        moved icon. Full scans are coarse-to-fine like `pyramid` mode and
+        cover a whole group of frames at once, a group that grows while the
+        buff stays absent. Returns (N, buffs) counts and confidences in
+        registry order.
+        """
+        # Built up front, chunks may run on several threads
+        if isinstance(self.full_scan_matcher, PyramidMatcher):
+            self.batch_matcher = self.full_scan_matcher
+        elif self.batch_matcher is None:
+            self.batch_matcher = PyramidMatcher(self.template_bank, self.pyramid_candidates)
+        n = len(frames)
+        counts = np.zeros((n, len(self.buff_names)), dtype=np.int16)
+        confidences = np.zeros((n, len(self.buff_names)), dtype=np.float32)
+        chunks = [(start, min(n, start + batch_size)) for start in range(0, n, batch_size)]
+        if self.executor is not None:
+            list(self.executor.map(lambda chunk: self.detectChunk(frames, chunk, counts, confidences), chunks))
+        else:
+            for chunk in chunks:
+                self.detectChunk(frames, chunk, counts, confidences)
+        return counts, confidences
+
+    def detectChunk(self, frames, chunk, counts, confidences):
+        start, stop = chunk
+        chunk_frames = np.ascontiguousarray(frames[start:stop])
+        n, h, w = chunk_frames.shape[:3]
+        # One colour conversion for the whole chunk
+        chunk_gray = toGray(chunk_frames.reshape((n * h, w) + chunk_frames.shape[3:])).reshape(n, h, w)
+
+        # Only frames that differ from their predecessor get matched, the rest copy its result
+        flat = chunk_gray.reshape(n, -1)
+        unique = np.ones(n, dtype=bool)
+        unique[1:] = (flat[1:] != flat[:-1]).any(axis=1)
+        unique_index = np.flatnonzero(unique)
+        unique_gray = chunk_gray[unique_index]
+        source = np.cumsum(unique) - 1
+
+        for column, name in enumerate(self.buff_names):
+            if name not in self.template_bank or not self.template_bank[name].templates:
+                continue
+            buff_templates = self.template_bank[name]
+            best_index, best_scores = self.trackBuff(buff_templates, unique_gray)
+            template_counts = np.array(buff_templates.counts, dtype=np.int16)
+            unique_counts = np.where(best_scores > MATCH_THRESHOLD, template_counts[best_index], 0)
+            counts[start:stop, column] = unique_counts[source]
+            confidences[start:stop, column] = best_scores[source]
+
+    def trackBuff(self, buff_templates, frames_gray):
+        n, h, w = frames_gray.shape
+        best_index = np.zeros(n, dtype=np.int64)
+        best_scores = np.zeros(n, dtype=np.float32)
+        pending = np.arange(n)
+        window_lock = SlotLock(self.slot_locks[buff_templates.name].padding if buff_templates.name in self.slot_locks else 8)
+        group_size = 1
+        while len(pending):
+            # Scan the next unresolved frames in full, they either place the icon or show it is absent
+            group = pending[:group_size]
+            group_index, group_scores, group_locations = self.scanFrames(buff_templates, frames_gray[group])
+            best_index[group] = group_index
+            best_scores[group] = group_scores
+            pending = pending[len(group):]
+            found = np.flatnonzero(group_scores > MATCH_THRESHOLD)
+            if not len(found):
+                group_size = min(group_size * 2, FULL_SCAN_BATCH)
+                continue
+            group_size = 1
+            if not len(pending):
+                continue
+
+            window_lock.lock(tuple(group_locations[found[-1]]))
+            window = window_lock.searchWindow(buff_templates, (h, w))
+            if window is None:
+                continue
+            x0, y0, x1, y1 = window
+            crops = np.ascontiguousarray(frames_gray[pending, y0:y1, x0:x1])
+            tall_crops = crops.reshape(len(pending) * (y1 - y0), x1 - x0)
+            scores = np.stack([batchScores(tall_crops, template, len(pending), y1 - y0) for template in buff_templates.templates], axis=1)
+            window_best = scores.argmax(axis=1)
+            window_scores = scores[np.arange(len(pending)), window_best]
+            found = window_scores > MATCH_THRESHOLD
+            best_index[pending[found]] = window_best[found]
+            best_scores[pending[found]] = window_scores[found]
+            pending = pending[~found]
+        return best_index, best_scores
+
+    def scanFrames(self, buff_templates, frames_gray):
+        """Full scans of an (n, H, W) stack of frames at once, coarse-to-fine like PyramidMatcher.
+
+        Every template is matched once against all frames shrunk and stacked
+        into one tall image. The best candidates of each frame are then
+        refined at full size around their coarse hit. Returns each frame's
+        best template index, score and (x, y, w, h).
+        """
+        matcher = self.batch_matcher
+        factor = 1 << matcher.depth
+        n, h, w = frames_gray.shape
+        best_index = np.zeros(n, dtype=np.int64)
+        best_scores = np.zeros(n, dtype=np.float32)
+        locations = np.zeros((n, 4), dtype=np.int64)
+        coarse_frames = np.stack([downsample(frame, matcher.depth) for frame in frames_gray])
+        coarse_h, coarse_w = coarse_frames.shape[1:]
+        tall_coarse = coarse_frames.reshape(n * coarse_h, coarse_w)
+
+        templates = buff_templates.templates
+        coarse_scores = np.full((n, len(templates)), -np.inf, dtype=np.float32)
+        coarse_hits = np.zeros((n, len(templates), 2), dtype=np.int64)
+        for i, coarse_template in enumerate(matcher.coarse_templates[buff_templates.name]):
+            th, tw = coarse_template.shape
+            if th > coarse_h or tw > coarse_w:
+                continue
+            result = cv2.matchTemplate(tall_coarse, coarse_template, cv2.TM_CCOEFF_NORMED)
+            per_frame = framesView(result, n, coarse_h, coarse_h - th + 1).reshape(n, -1)
+            best = per_frame.argmax(axis=1)
+            coarse_scores[:, i] = per_frame[np.arange(n), best]
+            coarse_hits[:, i, 0], coarse_hits[:, i, 1] = np.divmod(best, result.shape[1])
+
+        ranked = np.argsort(-coarse_scores, axis=1)[:, :matcher.candidates]
+        for frame in range(n):
+            for i in ranked[frame]:
+                if coarse_scores[frame, i] == -np.inf:
+                    continue
+                y, x = coarse_hits[frame, i] * factor
+                th, tw = templates[i].shape
+                x0 = max(0, x - factor)
+                y0 = max(0, y - factor)
+                x1 = min(w, x + tw + factor)
+                y1 = min(h, y + th + factor)
+                if x1 - x0 < tw or y1 - y0 < th:
+                    continue
+                rx, ry, _, _, score = findImage(templates[i], frames_gray[frame, y0:y1, x0:x1])
+                if score > best_scores[frame]:
+                    best_index[frame], best_scores[frame] = i, score
+                    locations[frame] = (rx + x0, ry + y0, tw, th)
+        return best_index, best_scores, locations
+
+def framesView(result, n, h, valid_rows):
+    """View of a matchTemplate result over n frames of height h stacked into one tall image, as (frame, row, column).
+
+    Only rows whose window sits inside one frame are kept.
+    """
+    return as_strided(result, shape=(n, valid_rows, result.shape[1]), strides=(h * result.strides[0], result.strides[0], result.strides[1]), writeable=False)
+
+def batchScores(tall_gray, template_gray, n, h):
+    """Best TM_CCOEFF_NORMED score of one template in each of the n frames stacked in `tall_gray`."""
+    th, tw = template_gray.shape
+    if th > h or tw > tall_gray.shape[1]:
+        return np.zeros(n, dtype=np.float32)
+    result = cv2.matchTemplate(tall_gray, template_gray, cv2.TM_CCOEFF_NORMED)
+    return framesView(result, n, h, h - th + 1).max(axis=(1, 2))
@@ -0,0 +1,215 @@
+import argparse
+import json
+import random
+import selectors
+import socket
+import threading
+import time
+
+from buff_registry import BUFFS
+
+DEFAULT_PORT = 47820
+# A subscriber that falls this far behind is dropped rather than buffered without end
+MAX_CLIENT_BUFFER = 256 * 1024
+# Keys of an event that are not buff counts
+EVENT_FIELDS = ('seq', 'time', 'profile', 'confidence')
+
+def encodeEvent(seq, timestamp, counts, confidences=None, profile=None):
+    """One event as a compact JSON line, e.g. {"seq":3,"time":1700000000.123,"souls":2,"necrosis":4,"deathsparks":0,"confidence":{...}}.
+
+    Every registered buff has its count, so buffs declared in config.json
+    show up as keys of their own. Events of a named profile also carry
+    "profile".
+    """
+    event = {'seq': seq, 'time': round(timestamp, 3)}
+    if profile is not None:
+        event['profile'] = profile
+    event.update({name: counts.get(name, 0) for name in BUFFS})
+    if confidences is not None:
+        event['confidence'] = {name: round(float(confidences.get(name, 0.0)), 3) for name in BUFFS}
+    return (json.dumps(event, separators=(',', ':')) + '\n').encode()
+
+class EventStream:
+    """Publishes stack count changes to any number of local subscribers.
+
+    Subscribers connect over TCP to `host:port` and read one JSON line per
+    change, starting with the current counts of every profile. `publish` only queues the
+    line and wakes the server thread, so the detection loop never waits on
+    a socket. Only bind to localhost unless you trust your network.
+    """
+
+    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT):
+        self.host = host
+        self.port = port
+        self.seq = 0
+        self.latest = {}
+        self.outbox = []
+        self.lock = threading.Lock()
+        self.clients = {}
+        self.selector = None
+        self.server = None
+        self.thread = None
+        self.closed = False
+
+    def start(self):
+        self.server = socket.create_server((self.host, self.port))
+        self.server.setblocking(False)
+        # Bound port, in case 0 was passed to pick a free one
+        self.port = self.server.getsockname()[1]
+        self.wake_recv, self.wake_send = socket.socketpair()
+        self.wake_recv.setblocking(False)
+        self.wake_send.setblocking(False)
+
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.server, selectors.EVENT_READ, 'accept')
+        self.selector.register(self.wake_recv, selectors.EVENT_READ, 'wake')
+        self.thread = threading.Thread(target=self.run, name='event-stream', daemon=True)
+        self.thread.start()
+        return self
+
+    def publish(self, counts, confidences=None, timestamp=None, profile=None):
+        """Queues a change for every subscriber, safe to call from any thread."""
+        with self.lock:
+            self.seq += 1
+            line = encodeEvent(self.seq, timestamp if timestamp is not None else time.time(), counts, confidences, profile)
+            self.latest[profile] = line
+            self.outbox.append((profile, line))
+        self.wake()
+
+    def wake(self):
+        try:
+            self.wake_send.send(b'\0')
+        except (BlockingIOError, OSError):
+            # A full wake pipe already guarantees the server thread runs
+            pass
+
+    def run(self):
+        while not self.closed:
+            for key, mask in self.selector.select():
+                if key.data == 'accept':
+                    self.accept()
+                elif key.data == 'wake':
+                    self.drainOutbox()
+                elif mask & selectors.EVENT_READ:
+                    self.readClient(key.fileobj)
+                elif mask & selectors.EVENT_WRITE:
+                    self.flush(key.fileobj)
+
+    def accept(self):
+        try:
+            client, _ = self.server.accept()
+        except (BlockingIOError, OSError):
+            return
+        client.setblocking(False)
+        with self.lock:
+            # New subscribers start from the current counts instead of waiting for the next change,
+            # except for profiles whose latest line is still queued and reaches them with the rest of the outbox
+            queued = {profile for profile, _ in self.outbox}
+            self.clients[client] = bytearray(b''.join(line for profile, line in self.latest.items() if profile not in queued))
+        self.selector.register(client, selectors.EVENT_READ, 'client')
+        self.flush(client)
+
+    def drainOutbox(self):
+        try:
+            while self.wake_recv.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+        with self.lock:
+            lines, self.outbox = b''.join(line for _, line in self.outbox), []
+        if not lines:
+            return
+        for client, buffer in list(self.clients.items()):
+            buffer.extend(lines)
+            if len(buffer) > MAX_CLIENT_BUFFER:
+                print("Dropping a slow event stream subscriber")
+                self.drop(client)
+            else:
+                self.flush(client)
+
+    def readClient(self, client):
+        # Subscribers only read, anything they send is ignored and an empty read means they left
+        try:
+            if not client.recv(4096):
+                self.drop(client)
+        except (BlockingIOError, InterruptedError):
+            pass
+        except OSError:
+            self.drop(client)
+
+    def flush(self, client):
+        buffer = self.clients.get(client)
+        if buffer is None:
+            return
+        try:
+            sent = client.send(buffer) if buffer else 0
+        except (BlockingIOError, InterruptedError):
+            sent = 0
+        except OSError:
+            self.drop(client)
+            return
+        del buffer[:sent]
+        # Writability is only watched while there is something left to send
+        self.selector.modify(client, selectors.EVENT_READ | selectors.EVENT_WRITE if buffer else selectors.EVENT_READ, 'client')
+
+    def drop(self, client):
+        self.clients.pop(client, None)
+        try:
+            self.selector.unregister(client)
+        except (KeyError, ValueError):
+            pass
+        client.close()
+
+    def close(self):
+        if self.thread is None or self.closed:
+            return
+        self.closed = True
+        self.wake()
+        self.thread.join(timeout=1)
+        for client in list(self.clients):
+            self.drop(client)
+        self.selector.close()
+        self.server.close()
+        self.wake_recv.close()
+        self.wake_send.close()
+
+def subscribe(host='127.0.0.1', port=DEFAULT_PORT):
+    """Reference client, yields every event published by a running overlay as a dict."""
+    with socket.create_connection((host, port)) as connection:
+        with connection.makefile('r', encoding='utf-8') as lines:
+            for line in lines:
+                yield json.loads(line)
+
+def runDemo(stream, rate):
+    """Publishes random stack changes, for testing clients without the game running."""
+    counts = {name: 0 for name in BUFFS}
+    while True:
+        name = random.choice(list(BUFFS))
+        buff = BUFFS[name]
+        count = max(0, min(buff.max_stacks, counts[name] + random.choice((-buff.step, buff.step))))
+        if count != counts[name]:
+            counts[name] = count
+            stream.publish(counts, {name: random.uniform(0.9, 1.0) for name in BUFFS})
+        time.sleep(1 / rate)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Prints the stack count events of a running overlay, or serves random ones with --demo.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--demo', action='store_true', help="Serve random events instead of subscribing")
+    parser.add_argument('--rate', type=float, default=4, help="Demo events per second")
+    args = parser.parse_args()
+
+    try:
+        if args.demo:
+            stream = EventStream(args.host, args.port).start()
+            print(f"Serving demo events on {args.host}:{stream.port}")
+            runDemo(stream, args.rate)
+        else:
+            for event in subscribe(args.host, args.port):
+                latency_ms = (time.time() - event['time']) * 1000
+                profile = f"{event['profile']}: " if 'profile' in event else ''
+                stacks = ' '.join(f"{name} {count}" for name, count in event.items() if name not in EVENT_FIELDS)
+                print(f"#{event['seq']} {profile}{stacks} ({latency_ms:.1f} ms)")
+    except KeyboardInterrupt:
+        pass
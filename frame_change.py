@@ -0,0 +1,57 @@
+import cv2
+import numpy as np
+
+class FrameChangeDetector:
+    """Decides whether a tick's frame differs enough from the last matched one to be worth matching.
+
+    The whole ROI is compared as a `factor` times smaller thumbnail. When every
+    tracked buff is slot-locked, only the locked icon regions are compared at
+    full resolution instead. A frame is only skipped `max_skipped_ticks` times
+    in a row so slow fades can never hide a change for long.
+    """
+
+    def __init__(self, factor=4, tolerance=6, max_skipped_ticks=20):
+        self.factor = factor
+        self.tolerance = tolerance
+        self.max_skipped_ticks = max_skipped_ticks
+        self.previous = None
+        self.previous_regions = None
+        self.skipped_in_a_row = 0
+        self.skipped_ticks = 0
+        self.processed_ticks = 0
+
+    def signature(self, game_screen_gray, regions):
+        if regions:
+            return np.concatenate([game_screen_gray[y:y + h, x:x + w].ravel() for x, y, w, h in regions])
+        h, w = game_screen_gray.shape
+        return cv2.resize(game_screen_gray, (max(1, w // self.factor), max(1, h // self.factor)), interpolation=cv2.INTER_AREA)
+
+    def hasChanged(self, game_screen_gray, regions=None):
+        regions = tuple(regions) if regions else None
+        current = self.signature(game_screen_gray, regions)
+        changed = (
+            self.previous is None
+            or regions != self.previous_regions
+            or current.shape != self.previous.shape
+            or self.skipped_in_a_row >= self.max_skipped_ticks
+            or cv2.absdiff(current, self.previous).max() > self.tolerance
+        )
+        if changed:
+            # Always compare against the last matched frame so small drifts add up
+            self.previous = current
+            self.previous_regions = regions
+            self.skipped_in_a_row = 0
+            self.processed_ticks += 1
+        else:
+            self.skipped_in_a_row += 1
+            self.skipped_ticks += 1
+        return changed
+
+    def reset(self):
+        self.previous = None
+        self.previous_regions = None
+        self.skipped_in_a_row = 0
+
+    def skipRatio(self):
+        total = self.skipped_ticks + self.processed_ticks
+        return self.skipped_ticks / total if total else 0.0
@@ -0,0 +1,191 @@
+import csv
+import json
+import os
+import sys
+
+import cv2
+import numpy as np
+
+from buff_registry import BUFFS
+from detector import toGray
+
+RECORDING_VERSION = 2
+FRAMES_FILE = 'frames.bin'
+RUNS_FILE = 'runs.bin'
+META_FILE = 'meta.json'
+LABELS_FILE = 'labels.csv'
+# Label columns of recordings whose meta.json does not name them
+V1_LABEL_COLUMNS = ('souls', 'necrosis', 'deathsparks')
+
+class FrameRecorder:
+    """Appends captured ROI frames to a raw, memory-mappable recording folder.
+
+    Frames are stored in grayscale, which is all detection reads, and a frame
+    identical to the one before is not stored again: `frames.bin` holds the
+    distinct frames back to back through a large write buffer, `runs.bin`
+    how many ticks in a row each one lasted. Shape and asset set go to
+    `meta.json`. Ground-truth counts are optional and are written to
+    `labels.csv`, one column per buff in `columns` (every registered buff by
+    default), with -1 for frames that have no label. When the
+    frame size changes, e.g. after a live ROI edit, the recording continues
+    in a new folder next to the first one, `<path>_2`, `<path>_3` and so on.
+    """
+
+    def __init__(self, path, asset_set=None, roi=None, buffer_size=4 * 1024 * 1024, columns=None):
+        self.base_path = path
+        self.columns = list(columns) if columns is not None else list(BUFFS)
+        self.segment = 1
+        self.path = path
+        self.asset_set = asset_set
+        self.roi = roi
+        self.buffer_size = buffer_size
+        self.shape = None
+        self.count = 0
+        self.labels = []
+        self.runs = []
+        self.previous = None
+        self.frames_file = None
+
+    def nextSegment(self, roi=None):
+        """Closes the frames recorded so far and continues in the next folder, with `roi` when given."""
+        if self.frames_file is not None:
+            self.close()
+            self.segment += 1
+            self.path = f'{self.base_path}_{self.segment}'
+        if roi is not None:
+            self.roi = dict(roi)
+        self.shape = None
+        self.count = 0
+        self.labels = []
+        self.runs = []
+        self.previous = None
+
+    def append(self, frame, label=None):
+        if self.frames_file is not None and frame.shape != self.shape:
+            self.nextSegment()
+        if self.frames_file is None:
+            os.makedirs(self.path, exist_ok=True)
+            self.shape = frame.shape
+            self.frames_file = open(os.path.join(self.path, FRAMES_FILE), 'wb', buffering=self.buffer_size)
+        frame_gray = toGray(frame)
+        if self.previous is not None and np.array_equal(frame_gray, self.previous):
+            self.runs[-1] += 1
+        else:
+            self.frames_file.write(np.ascontiguousarray(frame_gray, dtype=np.uint8).data)
+            self.runs.append(1)
+            self.previous = frame_gray.copy()
+        self.labels.append(tuple(label) if label is not None else (-1,) * len(self.columns))
+        self.count += 1
+
+    def close(self):
+        if self.frames_file is None:
+            return
+        self.frames_file.close()
+        self.frames_file = None
+        np.array(self.runs, dtype='<u4').tofile(os.path.join(self.path, RUNS_FILE))
+        with open(os.path.join(self.path, META_FILE), 'w') as f:
+            json.dump({'version': RECORDING_VERSION, 'shape': list(self.shape[:2]), 'dtype': 'uint8', 'count': self.count, 'stored': len(self.runs), 'columns': self.columns, 'asset_set': self.asset_set, 'roi': self.roi}, f)
+        # Any buff's label counts, a recording may leave some columns unlabelled
+        if any(count >= 0 for label in self.labels for count in label):
+            with open(os.path.join(self.path, LABELS_FILE), 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(self.columns)
+                writer.writerows(self.labels)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class RecordedFrames:
+    """Every tick's frame of a recording, read from the distinct stored frames without copying repeats."""
+
+    def __init__(self, stored, frame_index):
+        self.stored = stored
+        self.frame_index = frame_index
+        self.shape = (len(frame_index),) + stored.shape[1:]
+
+    def __len__(self):
+        return len(self.frame_index)
+
+    def __getitem__(self, key):
+        return self.stored[self.frame_index[key]]
+
+    def __iter__(self):
+        for index in self.frame_index:
+            yield self.stored[index]
+
+class FrameRecording:
+    """Read side of a recording folder, frames are memory-mapped rather than loaded.
+
+    `frames` has one frame per recorded tick. `stored_frames` are the
+    distinct frames actually on disk and `frame_index` maps every tick to
+    one of them. `columns` names the buffs of the label columns. Version 1
+    recordings, which stored every tick's BGRA frame, read the same way.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILE), 'r') as f:
+            self.meta = json.load(f)
+        self.shape = tuple(self.meta['shape'])
+        self.asset_set = self.meta.get('asset_set')
+        self.columns = list(self.meta.get('columns', V1_LABEL_COLUMNS))
+        # The file size wins over the stored count so an interrupted recording still opens
+        frame_bytes = int(np.prod(self.shape))
+        stored = os.path.getsize(os.path.join(path, FRAMES_FILE)) // frame_bytes
+        self.stored_frames = np.memmap(os.path.join(path, FRAMES_FILE), dtype=np.uint8, mode='r', shape=(stored,) + self.shape)
+        runs = np.ones(stored, dtype=np.int64)
+        runs_path = os.path.join(path, RUNS_FILE)
+        if os.path.exists(runs_path):
+            recorded_runs = np.fromfile(runs_path, dtype='<u4')[:stored]
+            runs[:len(recorded_runs)] = recorded_runs
+        self.frame_index = np.repeat(np.arange(stored), runs)
+        self.frames = RecordedFrames(self.stored_frames, self.frame_index)
+        self.labels = self.loadLabels(len(self.frame_index))
+
+    def loadLabels(self, count):
+        labels_path = os.path.join(self.path, LABELS_FILE)
+        if not os.path.exists(labels_path):
+            return None
+        with open(labels_path, 'r', newline='') as f:
+            rows = list(csv.DictReader(f))
+        labels = np.full((count, len(self.columns)), -1, dtype=np.int16)
+        for i, row in enumerate(rows[:count]):
+            labels[i] = [int(row[column]) for column in self.columns]
+        return labels
+
+    def __len__(self):
+        return len(self.frames)
+
+def isRecording(path):
+    return os.path.isfile(os.path.join(path, META_FILE)) and os.path.isfile(os.path.join(path, FRAMES_FILE))
+
+def importImageFolder(image_dir, path, asset_set=None, labels=None):
+    """Packs a folder of ROI screenshots into a recording.
+
+    labels is optional, either a dict keyed by file name or a list with one entry per image file in sorted
+    order, each entry holding one count per registered buff. Labels stay with their file when an image is skipped.
+    """
+    names = sorted(name for name in os.listdir(image_dir) if name.lower().endswith(('.png', '.bmp', '.jpg', '.jpeg')))
+    if isinstance(labels, list):
+        labels = dict(zip(names, labels))
+    with FrameRecorder(path, asset_set) as recorder:
+        for name in names:
+            frame = cv2.imread(os.path.join(image_dir, name), cv2.IMREAD_UNCHANGED)
+            if frame is None:
+                print(f"Skipping {name}: could not be read as an image")
+                continue
+            recorder.append(frame, labels.get(name) if labels is not None else None)
+    return FrameRecording(path)
+
+if __name__ == '__main__':
+    # Usage: python frame_recording.py <image_folder> <recording_folder> [asset_set] [labels.json]
+    # labels.json is a list with one entry per image, or an object keyed by image file name
+    labels = None
+    if len(sys.argv) > 4:
+        with open(sys.argv[4], 'r') as f:
+            labels = json.load(f)
+    recording = importImageFolder(sys.argv[1], sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None, labels)
+    print(f"Recorded {len(recording)} frames of {recording.shape} to {sys.argv[2]}")
@@ -1,7 +1,7 @@
-from PIL import Image
-from concurrent.futures import ThreadPoolExecutor
+# Imported first so startup phases are timed from as early as possible
+from startup_phases import StartupPhases
 from PyQt5 import QtCore, QtGui
-from PyQt5.QtCore import QTimer, Qt
+from PyQt5.QtCore import Qt, QTimer, pyqtSignal
 from PyQt5.QtWidgets import (
     QApplication,
     QLabel,
@@ -14,23 +14,22 @@ from PyQt5.QtWidgets import (
     QLineEdit,
     QComboBox
     )
-from PyQt5.QtGui import (
-    QPixmap,
-    QImage,
-    QKeySequence
-    )
-import cv2
-import numpy as np
-import mss
+from PyQt5.QtGui import QIntValidator, QKeySequence
 import json
 import sys
 import os
-import pygame
 import re
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
-# Initialize pygame mixer for sound
-pygame.mixer.init()
+# Modules pulling in numpy, OpenCV, mss or pygame are imported where they are first needed,
+# so the window can be up before they load
+from tick_scheduler import TickScheduler
+from alert_audio import AlertEngine, alertRules, createAudioDriver
+from buff_registry import BUFFS, registerBuffs, trackedBuffs
+from config_reload import ConfigWatcher, configChanges
+from profiles import SharedDetection, profileConfigs, profilePath
 
 if hasattr(sys, '_MEIPASS'):
     base_path = sys._MEIPASS
@@ -38,6 +37,7 @@ else:
     base_path = os.path.abspath(".")
 
 config_path = 'config.json'
+synthesized_path = 'synthesized_assets'
 
 def loadConfig():
     if os.path.exists(config_path):
@@ -52,71 +52,123 @@ def saveConfig(config):
 
 def getAvailableResolutions():
     resolutions = []
-    for folder in os.listdir(os.path.join(base_path, 'assets')):
-        if re.match(r'reso_*', folder):
-            resolutions.append(folder)
+    # Sets generated by template_synthesis.py are offered next to the shipped ones
+    for path in (os.path.join(base_path, 'assets'), synthesized_path):
+        if os.path.exists(path):
+            for folder in os.listdir(path):
+                if re.match(r'reso_*', folder) and folder not in resolutions:
+                    resolutions.append(folder)
     return resolutions
 
 def getWindowsScalingOptions(resolution):
     scaling_options = []
-    path = os.path.join(base_path, 'assets', resolution)
-    if os.path.exists(path):
-        for folder in os.listdir(path):
-            scaling_options.append(folder)
+    # Icon sizes only depend on the scaling, so every shipped scaling can be synthesized for any resolution
+    paths = [os.path.join(base_path, 'assets', resolution), os.path.join(synthesized_path, resolution)]
+    paths += [os.path.join(base_path, 'assets', folder) for folder in getAvailableResolutions()]
+    for path in paths:
+        if os.path.exists(path):
+            for folder in os.listdir(path):
+                if folder not in scaling_options:
+                    scaling_options.append(folder)
     return scaling_options
 
 def getBuffbarSizeOptions(resolution, windows_scaling):
     buffbar_sizes = []
-    path = os.path.join(base_path, 'assets', resolution, windows_scaling)
-    if os.path.exists(path):
-        for folder in os.listdir(path):
-            buffbar_sizes.append(folder)
+    paths = [os.path.join(base_path, 'assets', resolution, windows_scaling), os.path.join(synthesized_path, resolution, windows_scaling)]
+    paths += [os.path.join(base_path, 'assets', folder, scaling) for folder in getAvailableResolutions() for scaling in getWindowsScalingOptions(folder)]
+    for path in paths:
+        if os.path.exists(path):
+            for folder in os.listdir(path):
+                if folder not in buffbar_sizes:
+                    buffbar_sizes.append(folder)
     return buffbar_sizes
 
 config = loadConfig()
+# Buffs declared in config.json join the built-in ones before anything reads the registry
+registerBuffs(config)
 
 preconfigured = bool(config)
 
 main_roi = config.get('main_roi', {'left': 0, 'top': 0, 'width': 795, 'height': 160})
 scale = config.get('scale', 1/6.5)
 image_position = config.get('image_position', {'x': 0, 'y': 0})
-resolution = config.get('resolution', 'reso_3840x2160')
-windows_scaling = config.get('windows_scaling', 150)
-buffbar_size = config.get('buffbar_size', 'medium')
-update_rate = config.get('update_rate', 50)
 
-# Default to tracking all buffs
-track_souls = config.get('track_souls', True)
-track_necrosis = config.get('track_necrosis', True)
-track_deathsparks = config.get('track_deathsparks', True)
+def profileScales():
+    """The gauge scale of every profile, the asset bundle pre-scales its layers for all of them."""
+    return [profile_config.get('scale', 1/6.5) for _, profile_config in profileConfigs(config)]
 
-asset_path_prefix = os.path.join(base_path, 'assets', resolution, str(windows_scaling), buffbar_size)
+# Every gauge in this process by profile name, there is one per game client in config.json's `profiles`
+gauges = {}
 
-soul_alert_sound_path = os.path.join(base_path, 'assets', 'soul_alert.wav')
-necrosis_alert_sound_path = os.path.join(base_path, 'assets', 'necrosis_alert.wav')
+class TimedLabel(QLabel):
+    """QLabel that records how long Qt takes to paint it."""
+
+    def __init__(self, parent, stats):
+        super().__init__(parent)
+        self.stats = stats
+
+    def paintEvent(self, event):
+        start_time = time.perf_counter()
+        super().paintEvent(event)
+        if self.stats is not None:
+            self.stats.record('paint', (time.perf_counter() - start_time) * 1000)
 
 class ImageDisplay(QWidget):
-    def __init__(self):
+    # Emitted by the startup thread once the detector and gauge images are ready
+    detectionLoaded = pyqtSignal(dict)
+    # Emitted by the reload thread with the parts rebuilt for an edited config.json
+    reconfigurationLoaded = pyqtSignal(object)
+
+    def __init__(self, profile=None, profile_config=None, shared=None, profile_index=0):
         super().__init__()
 
-        self.soul_count = 0
-        self.necrosis_count = 0
-        self.deathspark_count = 0
+        self.startup = StartupPhases()
+        self.startup.mark('window init')
+
+        # Gauges of several profiles share one matcher pool, the asset bundle and template banks
+        self.profile = profile
+        self.profile_index = profile_index
+        self.shared = shared if shared is not None else SharedDetection()
+        self.applyProfile(profile_config if profile_config is not None else config)
+        gauges[profile] = self
+
+        self.counts = {name: 0 for name in BUFFS}
+
+        self.alert_engine = None
+        self.loadAlerts(self.config)
 
-        self.soul_alert_played = False
-        self.necrosis_alert_played = False
+        self.detection_worker = None
+        # Edits to config.json are applied in place, detectors and gauge images for them are built here one at a time
+        self.config_watcher = None
+        self.reload_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='reload')
 
-        self.template_list_souls = []
-        self.template_list_necrosis = []
-        self.template_list_deathsparks = []
+        # Stage timings from both the worker and the GUI thread, shown with Ctrl+Shift+S
+        self.pipeline_stats = None
+        self.metrics_log = None
 
-        self.modular_render_assets = {'souls':{},'necrosis':{},'deathsparks':{}}
-        self.loadModularRenderAssets()
+        self.asset_bundle = None
+        self.render_cache = None
+        self.shown_render_key = None
+        self.detectionLoaded.connect(self.startDetection)
+        self.reconfigurationLoaded.connect(self.applyReconfiguration)
+
+        if not preconfigured:
+            # The setup wizard previews the gauge right away, so it loads synchronously
+            self.loadRenderAssets(config)
 
         self.initUI()
 
+    def applyProfile(self, profile_config):
+        """Points this gauge at `profile_config`, the settings of its game client."""
+        self.config = profile_config
+        self.main_roi = dict(profile_config.get('main_roi', {'left': 1520, 'top': 1660, 'width': 795, 'height': 160}))
+        self.scale = profile_config.get('scale', 1/6.5)
+        self.image_position = profile_config.get('image_position', {'x': 0, 'y': 0})
+
     def initUI(self):
-        self.setWindowTitle('RS3 Necro Gauge')
+        self.setWindowTitle('RS3 Necro Gauge' if self.profile is None else f'RS3 Necro Gauge - {self.profile}')
+        # Only the setup wizard covers the whole screen, the live overlay is cut down to the gauge once it is drawn
+        self.compact_overlay = False
         self.setGeometry(0, 0, self.screen().size().width(), self.screen().size().height())
         self.setAttribute(QtCore.Qt.WA_TranslucentBackground, True)
         self.setAttribute(QtCore.Qt.WA_NoSystemBackground, True)
@@ -128,12 +180,19 @@ class ImageDisplay(QWidget):
         self.main_layout = QVBoxLayout(self)
         self.setLayout(self.main_layout)
 
-        self.image_label = QLabel(self)
-        self.image_label.setGeometry(0, 0, self.screen().size().width(), self.screen().size().height())
+        self.image_label = TimedLabel(self, None)
+
+        self.stats_panel = QLabel(self)
+        self.stats_panel.setStyleSheet("background-color: rgba(0, 0, 0, 180); color: white; font-family: monospace; padding: 4px;")
+        self.stats_panel.hide()
+        self.stats_timer = QTimer(self)
+        self.stats_timer.timeout.connect(self.updateStatsPanel)
+        self.stats_shortcut = QShortcut(QKeySequence("Ctrl+Shift+S"), self)
+        self.stats_shortcut.activated.connect(self.toggleStatsPanel)
 
         if preconfigured:
             # Apply saved settings directly
-            self.applyConfig(config)
+            self.applyConfig(self.config)
             self.roi_confirmed = True
         else:
             self.roi_confirmed = True
@@ -144,9 +203,6 @@ class ImageDisplay(QWidget):
 
         self.showFrame()
 
-        self.soul_count = 0
-        self.necrosis_count = 0
-
     def initResolutionStep(self):
         self.slider_box = QGroupBox("Resolution Settings", self)
         self.slider_box.setGeometry(800, 200, 500, 200)
@@ -156,7 +212,13 @@ class ImageDisplay(QWidget):
 
         # Resolution Dropdown
         self.resolution_dropdown = QComboBox(self)
-        self.resolution_dropdown.addItems(getAvailableResolutions()+['custom'])
+        resolutions = getAvailableResolutions()
+        # Templates for a screen without shipped assets are synthesized on first launch
+        screen_resolution = f'reso_{round(self.screen().size().width() * self.screen().devicePixelRatio())}x{round(self.screen().size().height() * self.screen().devicePixelRatio())}'
+        if screen_resolution not in resolutions:
+            resolutions.append(screen_resolution)
+        self.resolution_dropdown.addItems(resolutions+['custom'])
+        self.resolution_dropdown.setCurrentText(screen_resolution)
         self.resolution_label = QLabel('Resolution')
         self.slider_layout.addWidget(self.resolution_label)
         self.slider_layout.addWidget(self.resolution_dropdown)
@@ -185,6 +247,10 @@ class ImageDisplay(QWidget):
     def initWindowsScalingStep(self):
         # Window Scaling Dropdown
         self.windows_scaling_dropdown = QComboBox(self)
+        # Any scaling can be typed in, ones without a preset get their images synthesized
+        self.windows_scaling_dropdown.setEditable(True)
+        self.windows_scaling_dropdown.setInsertPolicy(QComboBox.NoInsert)
+        self.windows_scaling_dropdown.setValidator(QIntValidator(1, 1000, self))
         self.updateWindowsScalingOptions()
         self.windows_scaling_label = QLabel('Window Scaling')
         self.slider_layout.addWidget(self.windows_scaling_label)
@@ -196,7 +262,11 @@ class ImageDisplay(QWidget):
 
     def confirmWindowsScaling(self):
         global config
-        config['windows_scaling'] = self.windows_scaling_dropdown.currentText()
+        windows_scaling = self.windows_scaling_dropdown.currentText().strip()
+        if not windows_scaling.isdigit() or int(windows_scaling) == 0:
+            print("Enter the Windows scaling as a percentage, e.g. 175")
+            return
+        config['windows_scaling'] = str(int(windows_scaling))
 
         self.windows_scaling_label.setParent(None)
         self.windows_scaling_dropdown.setParent(None)
@@ -268,17 +338,12 @@ class ImageDisplay(QWidget):
         # Create checkboxes for each buff type
         from PyQt5.QtWidgets import QCheckBox
 
-        self.track_souls_checkbox = QCheckBox("Track Soul Stacks")
-        self.track_souls_checkbox.setChecked(True)
-        self.slider_layout.addWidget(self.track_souls_checkbox)
-
-        self.track_necrosis_checkbox = QCheckBox("Track Necrosis Stacks")
-        self.track_necrosis_checkbox.setChecked(True)
-        self.slider_layout.addWidget(self.track_necrosis_checkbox)
-
-        self.track_deathsparks_checkbox = QCheckBox("Track Death Spark Stacks")
-        self.track_deathsparks_checkbox.setChecked(True)
-        self.slider_layout.addWidget(self.track_deathsparks_checkbox)
+        self.track_checkboxes = {}
+        for name, buff in BUFFS.items():
+            checkbox = QCheckBox(f"Track {buff.label}")
+            checkbox.setChecked(True)
+            self.slider_layout.addWidget(checkbox)
+            self.track_checkboxes[name] = checkbox
 
         self.confirmBuffTracking_button = QPushButton('Confirm')
         self.confirmBuffTracking_button.clicked.connect(self.confirmBuffTracking)
@@ -286,13 +351,9 @@ class ImageDisplay(QWidget):
 
     def confirmBuffTracking(self):
         global config
-        config['track_souls'] = self.track_souls_checkbox.isChecked()
-        config['track_necrosis'] = self.track_necrosis_checkbox.isChecked()
-        config['track_deathsparks'] = self.track_deathsparks_checkbox.isChecked()
-
-        self.track_souls_checkbox.setParent(None)
-        self.track_necrosis_checkbox.setParent(None)
-        self.track_deathsparks_checkbox.setParent(None)
+        for name, checkbox in self.track_checkboxes.items():
+            config[f'track_{name}'] = checkbox.isChecked()
+            checkbox.setParent(None)
         self.confirmBuffTracking_button.setParent(None)
         self.slider_box.setTitle("Main ROI Settings")
         self.slider_box.setGeometry(800, 200, 500, 400)
@@ -324,14 +385,52 @@ class ImageDisplay(QWidget):
             slider.setValue(main_roi[key])
             slider.valueChanged.connect(self.updateROI)
 
+        self.autoROI_button = QPushButton('Auto Detect')
+        self.autoROI_button.clicked.connect(self.autoDetectROI)
         self.confirmROI_button = QPushButton('Confirm')
         self.confirmROI_button.clicked.connect(self.confirmROI)
 
         for key in self.main_roi_sliders.keys():
             self.slider_layout.addWidget(self.main_roi_labels[key])
             self.slider_layout.addWidget(self.main_roi_sliders[key])
+        self.slider_layout.addWidget(self.autoROI_button)
         self.slider_layout.addWidget(self.confirmROI_button)
 
+    def autoDetectROI(self):
+        global config
+        from calibration import calibrate
+        from screen_capture import grabScreenshot, primaryMonitorROI
+
+        try:
+            # The overlay is hidden for the grab so its ROI outline is not mistaken for the buff bar
+            self.hide()
+            QApplication.processEvents()
+            monitor = primaryMonitorROI()
+            screenshot = grabScreenshot(monitor)
+        except Exception as e:
+            print(f"An error occurred: {e}")
+            return
+        finally:
+            self.show()
+
+        tracked_buffs = trackedBuffs(config)
+        calibration = calibrate(screenshot, base_path, tracked_buffs, screen_offset=(monitor['left'], monitor['top']))
+        if calibration is None:
+            print("No buff icons found, make sure souls, necrosis or deathsparks are on the buff bar")
+            return
+        print(f"Found {', '.join(hit.buff for hit in calibration.hits)} with {calibration.asset_set} in {calibration.elapsed_ms:.0f} ms")
+        missing = [name for name in tracked_buffs if name not in {hit.buff for hit in calibration.hits}]
+        if missing:
+            print(f"Not on screen, widen the ROI with the sliders to cover them: {', '.join(missing)}")
+        values = calibration.configValues()
+        # Custom assets keep their own templates, only the ROI is taken over
+        if config.get('resolution') != 'custom':
+            config.update({key: values[key] for key in ('resolution', 'windows_scaling', 'buffbar_size')})
+        for key, slider in self.main_roi_sliders.items():
+            # Qt reports the screen in scaled pixels, the ROI is in physical ones
+            slider.setMaximum(max(slider.maximum(), values['main_roi'][key]))
+            slider.setValue(values['main_roi'][key])
+
     def confirmROI(self):
         global config, main_roi
         config['main_roi'] = main_roi
@@ -339,6 +438,7 @@ class ImageDisplay(QWidget):
         for key, slider in self.main_roi_sliders.items():
             slider.setParent(None)
             self.main_roi_labels[key].setParent(None)
+        self.autoROI_button.setParent(None)
         self.confirmROI_button.setParent(None)
         self.slider_box.setTitle("Image Settings")
         self.slider_box.setGeometry(800, 200, 500, 350)
@@ -373,7 +473,7 @@ class ImageDisplay(QWidget):
         self.slider_layout.addWidget(self.confirm_image_button)
 
     def updateImageProperties(self):
-        global scale, image_position, track_souls, track_necrosis, track_deathsparks
+        global scale, image_position
 
         # Update scale
         scale = self.scale_slider.value() / 100.0
@@ -381,47 +481,17 @@ class ImageDisplay(QWidget):
         # Update position
         image_position['x'] = self.x_slider.value()
         image_position['y'] = self.y_slider.value()
+        self.scale = scale
+        self.image_position = image_position
 
-        # Start with a blank image (all zeros)
-        frame = None
-
-        # Only add the buffs that are being tracked
-        if track_souls:
-            if frame is None:
-                frame = self.modular_render_assets['souls'][self.soul_count].copy()
-            else:
-                frame = frame + self.modular_render_assets['souls'][self.soul_count]
-
-        if track_necrosis:
-            if frame is None:
-                frame = self.modular_render_assets['necrosis'][self.necrosis_count].copy()
-            else:
-                frame = frame + self.modular_render_assets['necrosis'][self.necrosis_count]
-
-        if track_deathsparks:
-            if frame is None:
-                frame = self.modular_render_assets['deathsparks'][self.deathspark_count].copy()
-            else:
-                frame = frame + self.modular_render_assets['deathsparks'][self.deathspark_count]
-
-        # If no buffs are being tracked, use a blank image
-        if frame is None:
-            # Create a blank transparent image with the same dimensions as the buff images
-            sample_image = next(iter(self.modular_render_assets['souls'].values()))
-            frame = np.zeros_like(sample_image)
-
-        cv2image = cv2.cvtColor(cv2.resize(frame, (int(frame.shape[1] * scale), int(frame.shape[0] * scale))), cv2.COLOR_BGRA2RGBA)
-        image = Image.fromarray(cv2image, mode="RGBA")
-
-        # Convert the PIL image to a format suitable for QPixmap
-        data = image.tobytes("raw", "RGBA")
-        q_image = QImage(data, image.width, image.height, QImage.Format_RGBA8888)
-        pixmap = QPixmap.fromImage(q_image)
+        render_counts = self.renderCounts()
+        pixmap = self.render_cache.get(render_counts, scale)
+        self.shown_render_key = self.render_cache.key(render_counts, scale)
 
         # Update the QPixmap of the label
         self.image_label.setPixmap(pixmap)
         self.image_label.setFixedSize(pixmap.size())
-        self.image_label.setGeometry(self.x_slider.value(), self.y_slider.value(), cv2image.shape[0], cv2image.shape[1])
+        self.image_label.move(image_position['x'], image_position['y'])
 
     def updateROI(self):
         global main_roi
@@ -429,24 +499,44 @@ class ImageDisplay(QWidget):
             main_roi[key] = slider.value()
         self.update()
 
-    def loadModularRenderAssets(self):
-        if preconfigured:
-            for i in range(0, 6):
-                img_buffer = cv2.imread(os.path.join(base_path, 'assets', f'modular_render_assets\\s{i}.png'), cv2.IMREAD_UNCHANGED)
-                self.modular_render_assets['souls'][i] = cv2.resize(img_buffer, (int(img_buffer.shape[1] * scale), int(img_buffer.shape[0] * scale)))
-            for i in [0, 2, 4, 6, 8, 10, 12]:
-                img_buffer = cv2.imread(os.path.join(base_path, 'assets', f'modular_render_assets\\n{i}.png'), cv2.IMREAD_UNCHANGED)
-                self.modular_render_assets['necrosis'][i] = cv2.resize(img_buffer, (int(img_buffer.shape[1] * scale), int(img_buffer.shape[0] * scale)))
-            for i in range(0, 6):
-                img_buffer = cv2.imread(os.path.join(base_path, 'assets', f'modular_render_assets\\ds{i}.png'), cv2.IMREAD_UNCHANGED)
-                self.modular_render_assets['deathsparks'][i] = cv2.resize(img_buffer, (int(img_buffer.shape[1] * scale), int(img_buffer.shape[0] * scale)))
+    def loadAlerts(self, config):
+        if self.alert_engine is not None:
+            self.alert_engine.stop()
+        # Alert sounds are decoded once into memory, the mixer starts on its own thread
+        self.alert_engine = AlertEngine(alertRules(config, base_path, trackedBuffs(config)))
+        # Alerts fired before the mixer is up are skipped, each profile plays on its own mixer channels
+        first_channel = self.profile_index * len(BUFFS)
+        threading.Thread(target=self.initAudio, args=(self.alert_engine, config.get('audio_driver', 'pygame'), first_channel), name='audio-init', daemon=True).start()
+
+    def initAudio(self, alert_engine, audio_driver, first_channel=0):
+        try:
+            alert_engine.setDriver(createAudioDriver(alert_engine.rules, audio_driver, first_channel))
+            self.startup.mark('audio')
+        except Exception as e:
+            print(f"An error occurred: {e}")
+
+    def loadRenderAssets(self, config, buffs=None):
+        self.render_cache = self.buildRenderCache(config, buffs)
+
+    def buildRenderCache(self, config, buffs=None):
+        from overlay_render import RenderCache, gaugeShape, loadRenderLayers
+
+        render_assets_path = os.path.join(base_path, 'assets', 'modular_render_assets')
+        render_scale = config.get('scale', 1/6.5) if preconfigured else 1.0
+        if preconfigured and self.asset_bundle is not None and self.asset_bundle.hasScale(render_scale):
+            render_assets = self.asset_bundle.renderLayers(render_scale, buffs)
+        elif preconfigured:
+            render_assets = loadRenderLayers(render_assets_path, render_scale, buffs)
         else:
-            for i in range(0, 6):
-                self.modular_render_assets['souls'][i] = cv2.imread(os.path.join(base_path, 'assets', f'modular_render_assets\\s{i}.png'), cv2.IMREAD_UNCHANGED)
-            for i in [0, 2, 4, 6, 8, 10, 12]:
-                self.modular_render_assets['necrosis'][i] = cv2.imread(os.path.join(base_path, 'assets', f'modular_render_assets\\n{i}.png'), cv2.IMREAD_UNCHANGED)
-            for i in range(0, 6):
-                self.modular_render_assets['deathsparks'][i] = cv2.imread(os.path.join(base_path, 'assets', f'modular_render_assets\\ds{i}.png'), cv2.IMREAD_UNCHANGED)
+            render_assets = loadRenderLayers(render_assets_path)
+
+        # With no tracked buff drawn, the blank gauge still needs its size
+        gauge_shape = None
+        if not any(render_assets.values()):
+            gauge_shape = gaugeShape(render_assets_path, render_scale if preconfigured else None)
+
+        # Every gauge state is composited once and then reused as a ready QPixmap
+        return RenderCache(render_assets, render_scale, config.get('render_cache_budget_mb', 64) * 1024 * 1024, gauge_shape)
 
     def updateRateChanged(self):
         value = self.update_rate_slider.value()
@@ -465,7 +555,11 @@ class ImageDisplay(QWidget):
         self.windows_scaling_dropdown.clear()
         resolution = self.resolution_dropdown.currentText()
         scaling_options = getWindowsScalingOptions(resolution)
+        screen_scaling = str(round(self.screen().logicalDotsPerInch() / 96 * self.screen().devicePixelRatio() * 100))
+        if screen_scaling not in scaling_options:
+            scaling_options.append(screen_scaling)
         self.windows_scaling_dropdown.addItems(scaling_options)
+        self.windows_scaling_dropdown.setCurrentText(screen_scaling)
 
     def updateBuffbarSizeOptions(self):
         self.buffbar_size_dropdown.clear()
@@ -475,7 +569,7 @@ class ImageDisplay(QWidget):
         self.buffbar_size_dropdown.addItems(buffbar_sizes)
 
     def confirmImageSettings(self):
-        global config, scale, image_position
+        global config, scale, image_position, preconfigured
         config['scale'] = scale
         config['image_position'] = image_position
 
@@ -502,180 +596,351 @@ class ImageDisplay(QWidget):
             self.confirm_image_button.setParent(None)
             self.slider_box.setParent(None)
 
-            # Make the entire application click-through
-            self.restartApplication()
+            # The wizard window turns into the click-through overlay and starts detecting in place
+            preconfigured = True
+            self.setAttribute(QtCore.Qt.WA_TransparentForMouseEvents, True)
+            self.setAttribute(QtCore.Qt.WA_NoChildEventsForParent, True)
+            # Recreates the native window with the new attributes, applyConfig shows it again
+            self.setWindowFlags(self.windowFlags())
+            self.render_cache = None
+            self.shown_render_key = None
+            self.loadAlerts(config)
+            self.applyConfig(config)
 
     def applyConfig(self, config):
-        global scale, image_position, main_roi, resolution, windows_scaling, buffbar_size, update_rate, asset_path_prefix
-        global track_souls, track_necrosis, track_deathsparks
-        main_roi = config.get('main_roi', {'left': 1520, 'top': 1660, 'width': 795, 'height': 160})
-        scale = config.get('scale', 1/6.5)
-        image_position = config.get('image_position', {'x': 0, 'y': 0})
+        self.applyProfile(config)
+
+        self.compact_overlay = config.get('compact_overlay', True)
+        self.placeOverlay()
+        self.show()
+
+        if config.get('fast_start', True):
+            # The empty overlay is already up, detection joins in once its heavy imports and assets are loaded
+            threading.Thread(target=self.loadDetection, args=(config,), name='startup', daemon=True).start()
+        else:
+            self.loadDetection(config)
+
+    def templateSource(self, config):
+        """The bundle key and folder of the templates for `config`'s asset set, synthesizing them when needed."""
+        from template_synthesis import SYNTHESIZED_ASSETS, synthesizeAssetSet, templateDir
+
         resolution = config.get('resolution', 'reso_3840x2160')
         windows_scaling = config.get('windows_scaling', 150)
         buffbar_size = config.get('buffbar_size', 'medium')
-        update_rate = config.get('update_rate', 50)
-        track_souls = config.get('track_souls', True)
-        track_necrosis = config.get('track_necrosis', True)
-        track_deathsparks = config.get('track_deathsparks', True)
         if resolution == 'custom':
-            asset_path_prefix = os.path.join('custom_assets', str(windows_scaling), buffbar_size)
-        else:
-            asset_path_prefix = os.path.join(base_path, 'assets', resolution, str(windows_scaling), buffbar_size)
+            return f'custom_assets/{windows_scaling}/{buffbar_size}', os.path.join('custom_assets', str(windows_scaling), buffbar_size)
+        template_dir, template_path = templateDir(base_path, resolution, windows_scaling, buffbar_size)
+        if template_dir.startswith(SYNTHESIZED_ASSETS):
+            # Settings without shipped templates get them rescaled from the closest shipped set, once
+            synthesizeAssetSet(base_path, resolution, windows_scaling, buffbar_size)
+        return template_dir, template_path
+
+    def buildDetector(self, config, template_dir, template_path):
+        from detector import NecroDetector
+
+        packed_templates = self.asset_bundle.templates(template_dir) if self.asset_bundle is not None else None
+        template_bank = self.shared.templateBank(template_path, trackedBuffs(config), packed_templates)
+        # All detection lives in the headless detector, the overlay only consumes its counts
+        return NecroDetector(config, template_path, packed_templates=packed_templates, template_bank=template_bank)
+
+    def loadDetection(self, config):
+        """Imports and builds everything detection needs, safe to run off the GUI thread."""
+        try:
+            from frame_recording import FrameRecorder
+            from pipeline_stats import PipelineStats
+            from screen_capture import createCaptureBackend
+            self.startup.mark('imports')
+
+            template_dir, template_path = self.templateSource(config)
+
+            # Once configured, templates and pre-scaled layers are mapped from one bundle instead of decoding PNGs
+            if config.get('asset_bundle', 'asset_bundle.bin'):
+                # Opened once for all profiles, with the layers pre-scaled for each of their scales
+                self.asset_bundle = self.shared.assetBundle(config.get('asset_bundle', 'asset_bundle.bin'), base_path, 'custom_assets', profileScales())
+            # Layers of untracked buffs are never drawn, so they are never loaded
+            self.loadRenderAssets(config, trackedBuffs(config))
+            self.startup.mark('assets')
+
+            self.detector = self.buildDetector(config, template_dir, template_path)
+
+            # One capture session for the lifetime of the app, `capture_source` swaps in recorded frames
+            self.capture = createCaptureBackend(self.main_roi, config.get('capture_source'))
+
+            # Every captured frame can be dumped for offline benchmarking with benchmark.py
+            self.recorder = None
+            if config.get('record_frames_to'):
+                asset_set = f"{config.get('resolution')}/{config.get('windows_scaling')}/{config.get('buffbar_size')}"
+                self.recorder = FrameRecorder(profilePath(config['record_frames_to'], self.profile), asset_set, self.main_roi)
+
+            # Count changes can be streamed to other tools on this machine, see event_stream.py
+            self.event_stream = None
+            if config.get('event_stream', False):
+                from event_stream import DEFAULT_PORT
+                self.event_stream = self.shared.eventStream(config.get('event_stream_port', DEFAULT_PORT))
+
+            # Stack timelines for reviewing fights afterwards with session_log.py
+            self.session_log = None
+            if config.get('session_log'):
+                from session_log import SessionLog
+                self.session_log = SessionLog(config['session_log'], profile=self.profile)
+
+            self.pipeline_stats = PipelineStats()
+            self.startup.mark('detector')
+            self.detectionLoaded.emit(config)
+        except Exception as e:
+            print(f"An error occurred: {e}")
 
-        for i in range(1, 6):
-            self.template_list_souls.append(cv2.imread(os.path.join(asset_path_prefix, f'soul_{i}.png'), cv2.IMREAD_COLOR))
-            self.template_list_souls.append(cv2.imread(os.path.join(asset_path_prefix, f'soul_{i}_alt.png'), cv2.IMREAD_COLOR))
-        for i in [2, 4, 6, 8, 10, 12]:
-            self.template_list_necrosis.append(cv2.imread(os.path.join(asset_path_prefix, f'necrosis_{i}.png'), cv2.IMREAD_COLOR))
-        for i in range(1, 6):
-            self.template_list_deathsparks.append(cv2.imread(os.path.join(asset_path_prefix, f'deathspark_{i}.png'), cv2.IMREAD_COLOR))
+    def schedulerRates(self, config):
+        # Ticks speed up in combat and near the alert stacks, and slow down when the bar stays empty
+        return {
+            'update_rate': config.get('update_rate', 50),
+            'fast_rate': config.get('fast_update_rate'),
+            'idle_rate': config.get('idle_update_rate'),
+            'idle_after': config.get('idle_after', 10),
+            'hot_counts': self.alert_engine.hotCounts(),
+            'adaptive': config.get('adaptive_update_rate', True),
+        }
 
-        self.show()
+    def startDetection(self, config):
+        from detection_worker import DetectionWorker
 
-        self.updateStacks()
+        self.image_label.stats = self.pipeline_stats
 
-    def showFrame(self):
-        # start_time = time.time()
-        global scale, image_position, track_souls, track_necrosis, track_deathsparks
-
-        # Start with a blank image (all zeros)
-        stacked_image = None
-
-        # Only add the buffs that are being tracked
-        if track_souls:
-            if stacked_image is None:
-                stacked_image = self.modular_render_assets['souls'][self.soul_count].copy()
-            else:
-                stacked_image = stacked_image + self.modular_render_assets['souls'][self.soul_count]
-
-        if track_necrosis:
-            if stacked_image is None:
-                stacked_image = self.modular_render_assets['necrosis'][self.necrosis_count].copy()
-            else:
-                stacked_image = stacked_image + self.modular_render_assets['necrosis'][self.necrosis_count]
-
-        if track_deathsparks:
-            if stacked_image is None:
-                stacked_image = self.modular_render_assets['deathsparks'][self.deathspark_count].copy()
-            else:
-                stacked_image = stacked_image + self.modular_render_assets['deathsparks'][self.deathspark_count]
-
-        # If no buffs are being tracked, use a blank image
-        if stacked_image is None:
-            # Create a blank transparent image with the same dimensions as the buff images
-            sample_image = next(iter(self.modular_render_assets['souls'].values()))
-            stacked_image = np.zeros_like(sample_image)
+        # Capture and matching run on the worker thread, the GUI thread only repaints on count changes
+        scheduler = TickScheduler(**self.schedulerRates(config))
+        self.detection_worker = DetectionWorker(self.capture, self.detector, scheduler, self.recorder, self.pipeline_stats, self.event_stream, self.session_log, self.shared.executor, self.profile)
+        self.detection_worker.countsChanged.connect(self.onCountsChanged)
+        self.detection_worker.firstDetection.connect(self.onFirstDetection)
 
-        if preconfigured:
-            cv2image = cv2.cvtColor(stacked_image, cv2.COLOR_BGRA2RGBA)
-        else:
-            cv2image = cv2.cvtColor(cv2.resize(stacked_image, (int(stacked_image.shape[1] * scale), int(stacked_image.shape[0] * scale))), cv2.COLOR_BGRA2RGBA)
-        image = Image.fromarray(cv2image, mode="RGBA")
+        if config.get('render_cache_prewarm', False):
+            self.render_cache.prewarm(self.detector.tracked_buffs, self.scale)
 
-        data = image.tobytes("raw", "RGBA")
-        q_image = QImage(data, image.width, image.height, QImage.Format_RGBA8888)
-        pixmap = QPixmap.fromImage(q_image)
+        self.startMetricsLog(config)
 
-        self.image_label.setPixmap(pixmap)
-        self.image_label.setFixedSize(pixmap.size())
-        self.image_label.move(image_position['x'], image_position['y'])
-        # print((time.time()-start_time)*1000)
-
-    def captureScreen(self):
-        with mss.mss() as sct:
-            screenshot = sct.grab(main_roi)
-            return np.array(screenshot)
-
-    def findImage(self, template, screenshot):
-        template_gray = cv2.cvtColor(template, cv2.COLOR_BGR2GRAY)
-        screenshot_gray = cv2.cvtColor(screenshot, cv2.COLOR_BGR2GRAY)
-        result = cv2.matchTemplate(screenshot_gray, template_gray, cv2.TM_CCOEFF_NORMED)
-        _, max_val, _, max_loc = cv2.minMaxLoc(result)
-        h, w = template_gray.shape
-        top_left = max_loc
-        return top_left[0], top_left[1], w, h, max_val
-
-    def matchTemplates(self, template_list, game_screen):
-        score_list = []
-        match_list = []
-        for template in template_list:
-            M = self.findImage(template, game_screen)
-            match_list.append(M)
-            score_list.append(M[-1])
-        max_index, max_value = max(enumerate(score_list), key=lambda x: x[1])
-        return max_index, max_value, match_list
-
-    def updateStacks(self):
-        global track_souls, track_necrosis, track_deathsparks
-        game_screen = self.captureScreen()
+        self.showFrame()
+        self.startup.mark('first frame')
+
+        self.detection_worker.start()
+
+        # Edits to config.json made while the overlay runs are applied without a restart, the first gauge watches for all
+        if self.profile_index == 0 and config.get('watch_config', True):
+            self.config_watcher = ConfigWatcher(config_path)
+            self.config_timer = QTimer(self)
+            self.config_timer.timeout.connect(self.pollConfig)
+            self.config_timer.start(int(config.get('config_watch_interval', 1) * 1000))
+
+    def startMetricsLog(self, config):
+        from pipeline_stats import MetricsLog
+
+        if self.metrics_log is not None:
+            self.metrics_timer.stop()
+            self.metrics_log = None
+        # Stage timings can be logged periodically for offline comparison, .csv or JSON lines
+        if config.get('metrics_log'):
+            self.metrics_log = MetricsLog(profilePath(config['metrics_log'], self.profile), self.pipeline_stats)
+            self.metrics_timer = QTimer(self)
+            self.metrics_timer.timeout.connect(self.writeMetrics)
+            self.metrics_timer.start(int(config.get('metrics_log_interval', 5) * 1000))
+
+    def pollConfig(self):
+        global config
+        new_config = self.config_watcher.poll()
+        if new_config is None:
+            return
+        config = new_config
+        profiles = dict(profileConfigs(new_config))
+        if set(profiles) != set(gauges):
+            print("Restart to apply: profiles")
+        for profile, gauge in gauges.items():
+            if profile in profiles:
+                gauge.reloadConfig(profiles[profile])
+
+    def reloadConfig(self, new_config):
+        """Applies an edited config.json to the running overlay, only rebuilding the parts whose keys changed."""
+        start_time = time.perf_counter()
+        targets, restart_keys = configChanges(self.config, new_config)
+        if restart_keys:
+            print(f"Restart to apply: {', '.join(restart_keys)}")
+        if not targets:
+            return
+        self.applyProfile(new_config)
         try:
-            with ThreadPoolExecutor() as executor:
-                # Only process the buffs that are being tracked
-                futures = {}
-
-                if track_souls:
-                    futures['souls'] = executor.submit(self.matchTemplates, self.template_list_souls, game_screen)
-
-                if track_necrosis:
-                    futures['necrosis'] = executor.submit(self.matchTemplates, self.template_list_necrosis, game_screen)
-
-                if track_deathsparks:
-                    futures['deathsparks'] = executor.submit(self.matchTemplates, self.template_list_deathsparks, game_screen)
-
-                # Process results for tracked buffs
-                if 'souls' in futures:
-                    max_index_souls, max_value_souls, _ = futures['souls'].result()
-                    if max_value_souls > 0.9:
-                        self.soul_count = (max_index_souls // 2) + 1
-                    else:
-                        self.soul_count = 0
-
-                if 'necrosis' in futures:
-                    max_index_necrosis, max_value_necrosis, _ = futures['necrosis'].result()
-                    if max_value_necrosis > 0.9:
-                        self.necrosis_count = (max_index_necrosis + 1) * 2
-                    else:
-                        self.necrosis_count = 0
-
-                if 'deathsparks' in futures:
-                    max_index_deathsparks, max_value_deathsparks, _ = futures['deathsparks'].result()
-                    if max_value_deathsparks > 0.9:
-                        self.deathspark_count = (max_index_deathsparks + 1)
-                    else:
-                        self.deathspark_count = 0
+            from screen_capture import createCaptureBackend
+
+            if 'position' in targets:
+                self.compact_overlay = new_config.get('compact_overlay', True)
+                self.placeOverlay()
+            # The scheduler's hot counts come from the alert rules, so alerts are rebuilt first
+            if 'alerts' in targets:
+                self.loadAlerts(new_config)
+            if 'scheduler' in targets:
+                self.detection_worker.reconfigure(rates=self.schedulerRates(new_config))
+            if 'roi' in targets and not new_config.get('capture_source'):
+                self.detection_worker.reconfigure(roi=dict(self.main_roi))
+            if 'capture' in targets:
+                self.detection_worker.reconfigure(capture=createCaptureBackend(self.main_roi, new_config.get('capture_source')))
+            if 'metrics' in targets:
+                self.startMetricsLog(new_config)
+
+            rebuild = targets & {'detector', 'render'}
+            if 'render' in targets and self.render_cache is not None:
+                drawn_buffs = [name for name in trackedBuffs(new_config) if BUFFS[name].render_layers]
+                # A smaller scale is resized from the layers already loaded, nothing to rebuild. A larger one
+                # would upsample layers already shrunk to the old scale, so those are loaded again at full detail
+                if self.scale <= self.render_cache.base_scale and all(self.render_cache.render_assets.get(name) for name in drawn_buffs):
+                    self.shown_render_key = None
+                    self.showFrame()
+                    if self.render_cache.budget_bytes == new_config.get('render_cache_budget_mb', 64) * 1024 * 1024:
+                        rebuild.discard('render')
+            if rebuild:
+                # Templates and gauge layers are loaded off the GUI thread, the worker keeps detecting meanwhile
+                self.reload_executor.submit(self.loadReconfiguration, new_config, rebuild)
+        except Exception as e:
+            print(f"An error occurred: {e}")
+        profile = f'{self.profile}: ' if self.profile is not None else ''
+        print(f"{profile}Applied config.json edit ({', '.join(sorted(targets))}) in {(time.perf_counter() - start_time) * 1000:.1f} ms")
 
-            self.showFrame()
+    def loadReconfiguration(self, config, targets):
+        try:
+            parts = {}
+            if 'render' in targets:
+                parts['render_cache'] = self.buildRenderCache(config, trackedBuffs(config))
+            if 'detector' in targets:
+                # The bundle stays mapped as it is, templates it does not hold are read from their folder
+                parts['detector'] = self.buildDetector(config, *self.templateSource(config))
+            self.reconfigurationLoaded.emit(parts)
+        except Exception as e:
+            print(f"An error occurred: {e}")
+
+    def applyReconfiguration(self, parts):
+        if 'render_cache' in parts:
+            self.render_cache = parts['render_cache']
+            self.shown_render_key = None
+        if 'detector' in parts:
+            self.detector = parts['detector']
+            self.detection_worker.reconfigure(detector=self.detector)
+        self.showFrame()
 
-            # Only play alerts for tracked buffs
-            if track_souls and self.soul_count == 5 and not self.soul_alert_played:
-                self.playAlert('soul')
-                self.soul_alert_played = True
-            elif not track_souls or self.soul_count < 5:
-                self.soul_alert_played = False
+    def onFirstDetection(self):
+        self.startup.mark('first detection')
+        print(self.startup.report())
 
-            if track_necrosis and self.necrosis_count == 12 and not self.necrosis_alert_played:
-                self.playAlert('necrosis')
-                self.necrosis_alert_played = True
-            elif not track_necrosis or self.necrosis_count < 12:
-                self.necrosis_alert_played = False
+    def renderCounts(self):
+        # Untracked buffs, and buffs without gauge layers, are left out of the gauge entirely
+        tracked_buffs = trackedBuffs(self.config)
+        return {name: self.counts[name] if name in tracked_buffs and buff.render_layers else None for name, buff in BUFFS.items()}
+
+    def showFrame(self):
+        if self.render_cache is None:
+            return
+
+        # The overlay is only swapped when the gauge state actually changed
+        render_counts = self.renderCounts()
+        render_key = self.render_cache.key(render_counts, self.scale)
+        if render_key == self.shown_render_key:
+            return
+        start_time = time.perf_counter()
+        pixmap = self.render_cache.get(render_counts, self.scale)
+        self.shown_render_key = render_key
+
+        self.image_label.setPixmap(pixmap)
+        if self.image_label.size() != pixmap.size():
+            self.image_label.setFixedSize(pixmap.size())
+            self.placeOverlay()
+        if self.pipeline_stats is not None:
+            self.pipeline_stats.record('compose', (time.perf_counter() - start_time) * 1000)
+
+    def placeOverlay(self):
+        """Moves the gauge to `image_position` with the stats panel below it.
+
+        In compact mode the window itself is resized and moved to just cover
+        them, so only the gauge's pixels are blended over the game. Otherwise
+        the window covers the screen and the gauge moves inside it.
+        """
+        panel_shown = not self.stats_panel.isHidden()
+        gauge_size = self.image_label.size()
+        if self.compact_overlay:
+            origin = QtCore.QPoint(0, 0)
+            width, height = gauge_size.width(), gauge_size.height()
+            if panel_shown:
+                width = max(width, self.stats_panel.width())
+                height += 4 + self.stats_panel.height()
+            geometry = QtCore.QRect(self.image_position['x'], self.image_position['y'], max(1, width), max(1, height))
+        else:
+            origin = QtCore.QPoint(self.image_position['x'], self.image_position['y'])
+            geometry = QtCore.QRect(0, 0, self.screen().size().width(), self.screen().size().height())
+
+        self.image_label.move(origin)
+        # Sits just below the gauge
+        self.stats_panel.move(origin.x(), origin.y() + gauge_size.height() + 4)
+        if self.geometry() != geometry:
+            self.setGeometry(geometry)
+
+    def schedulerStats(self):
+        if self.detection_worker is None:
+            return {}
+        scheduler = self.detection_worker.scheduler
+        return {'update_rate_ms': scheduler.currentRate(), 'ticks': scheduler.ticks, 'missed_ticks': scheduler.missed_ticks}
+
+    def toggleStatsPanel(self):
+        if self.stats_panel.isVisible():
+            self.stats_timer.stop()
+            self.stats_panel.hide()
+            self.placeOverlay()
+        else:
+            self.stats_panel.show()
+            self.updateStatsPanel()
+            self.stats_timer.start(500)
 
+    def updateStatsPanel(self):
+        if self.pipeline_stats is None:
+            text = 'Loading...'
+        else:
+            scheduler_stats = self.schedulerStats()
+            text = self.pipeline_stats.formatSummary()
+            if scheduler_stats:
+                text += f"\nrate {scheduler_stats['update_rate_ms']:.0f} ms, {scheduler_stats['missed_ticks']} of {scheduler_stats['ticks']} ticks late"
+        self.stats_panel.setText(text)
+        self.stats_panel.adjustSize()
+        self.placeOverlay()
+
+    def writeMetrics(self):
+        try:
+            self.metrics_log.write(self.schedulerStats())
         except Exception as e:
             print(f"An error occurred: {e}")
 
-        QTimer.singleShot(update_rate, self.updateStacks)
+    def onCountsChanged(self, counts):
+        self.counts = counts
+        try:
+            # Alerts go first, playing only queues an already decoded sound
+            self.alert_engine.observe(counts)
+            self.showFrame()
+        except Exception as e:
+            print(f"An error occurred: {e}")
 
-    def playAlert(self, type):
-        if type == 'soul':
-            pygame.mixer.music.load(soul_alert_sound_path)
-            pygame.mixer.music.play()
-        elif type == 'necrosis':
-            pygame.mixer.music.load(necrosis_alert_sound_path)
-            pygame.mixer.music.play()
+    def stopDetection(self):
+        if self.detection_worker is None or not self.detection_worker.isRunning():
+            return
+        self.detection_worker.stop()
+        self.detection_worker.wait()
+        if self.detection_worker.session_log is not None:
+            self.detection_worker.session_log.close()
+        if self.metrics_log is not None:
+            self.writeMetrics()
+        change_detector = self.detection_worker.detector.change_detector
+        if change_detector is not None:
+            print(f"Skipped {change_detector.skipped_ticks} unchanged ticks, matched {change_detector.processed_ticks} ({change_detector.skipRatio():.0%} saved)")
+        scheduler = self.detection_worker.scheduler
+        print(f"Ran {scheduler.ticks} ticks, dropped {scheduler.missed_ticks} late ticks")
 
     def closeApplication(self):
-        pygame.mixer.music.stop()
-        self.close()
+        # The gauges of all profiles run in this process, closing one closes them all
+        for gauge in list(gauges.values()):
+            gauge.alert_engine.stop()
+            gauge.reload_executor.shutdown(wait=False)
+            gauge.stopDetection()
+            gauge.close()
 
     def paintEvent(self, event):
         if not self.roi_confirmed:
@@ -686,17 +951,15 @@ class ImageDisplay(QWidget):
             painter.drawRect(main_roi['left'], main_roi['top'], main_roi['width'], main_roi['height'])
         super().paintEvent(event)
 
-    def restartApplication(self):
-        """Restart the current script, with file objects and descriptors cleanup"""
-        try:
-            print("Restarting script...")
-            # Close all file descriptors to avoid issues with open files
-            os.execl(sys.executable, sys.executable, *sys.argv)
-        except Exception as e:
-            print(f"Error restarting script: {e}")
-
 if __name__ == '__main__':
     app = QApplication(sys.argv)
-    ex = ImageDisplay()
-    ex.show()
-    sys.exit(app.exec_())
\ No newline at end of file
+    # One gauge per profile in config.json, all matching on one pool sized to the cores
+    shared = SharedDetection()
+    profiles = profileConfigs(config) if preconfigured else [(None, config)]
+    for index, (profile, profile_config) in enumerate(profiles):
+        gauge = ImageDisplay(profile, profile_config, shared, index)
+        app.aboutToQuit.connect(gauge.stopDetection)
+        gauge.show()
+    exit_code = app.exec_()
+    shared.shutdown()
+    sys.exit(exit_code)
\ No newline at end of file
@@ -0,0 +1,146 @@
+import os
+import sys
+from collections import OrderedDict
+from itertools import product
+
+import cv2
+import numpy as np
+from PyQt5.QtGui import QImage, QPixmap
+
+from buff_registry import BUFFS
+
+def loadRenderLayers(render_assets_path, scale=None, buffs=None):
+    """Decodes the BGRA gauge layers of `buffs` (all by default), resized by `scale` when given.
+
+    Layers come in the registry's bottom-to-top drawing order, missing files are skipped.
+    """
+    render_assets = {name: {} for name in BUFFS}
+    for name, buff in BUFFS.items():
+        if buffs is not None and name not in buffs:
+            continue
+        for file_name, count in buff.render_layers:
+            img_buffer = cv2.imread(os.path.join(render_assets_path, f'{file_name}.png'), cv2.IMREAD_UNCHANGED)
+            if img_buffer is None:
+                continue
+            if scale is not None:
+                img_buffer = cv2.resize(img_buffer, (int(img_buffer.shape[1] * scale), int(img_buffer.shape[0] * scale)))
+            render_assets[name][count] = img_buffer
+    return render_assets
+
+def gaugeShape(render_assets_path, scale=None):
+    """Shape of the whole gauge at `scale`, read from the first layer found since every layer covers the whole gauge."""
+    for buff in BUFFS.values():
+        for file_name, _ in buff.render_layers:
+            img_buffer = cv2.imread(os.path.join(render_assets_path, f'{file_name}.png'), cv2.IMREAD_UNCHANGED)
+            if img_buffer is None:
+                continue
+            if scale is not None:
+                return (int(img_buffer.shape[0] * scale), int(img_buffer.shape[1] * scale), img_buffer.shape[2])
+            return img_buffer.shape
+    return None
+
+def compositeLayers(layers):
+    """Draws BGRA layers bottom to top with the alpha 'over' operator."""
+    color = np.zeros(layers[0].shape[:2] + (3,), dtype=np.float32)
+    alpha = np.zeros(layers[0].shape[:2] + (1,), dtype=np.float32)
+    for layer in layers:
+        layer_alpha = layer[..., 3:4].astype(np.float32) / 255
+        # Premultiplied colour so transparent pixels never leak into the result
+        color = layer[..., :3] * layer_alpha + color * (1 - layer_alpha)
+        alpha = layer_alpha + alpha * (1 - layer_alpha)
+    color = np.divide(color, alpha, out=np.zeros_like(color), where=alpha > 0)
+    return np.dstack([color, alpha * 255]).round().clip(0, 255).astype(np.uint8)
+
+def toQImage(bgra_image):
+    """Wraps a BGRA array as a QImage without copying the pixels.
+
+    On little-endian hosts BGRA bytes already are Qt's native ARGB32 layout.
+    The QImage only borrows the buffer, so the array is kept alive on it.
+    """
+    if sys.byteorder == 'little':
+        buffer = np.ascontiguousarray(bgra_image)
+        image_format = QImage.Format_ARGB32
+    else:
+        buffer = cv2.cvtColor(bgra_image, cv2.COLOR_BGRA2RGBA)
+        image_format = QImage.Format_RGBA8888
+    q_image = QImage(buffer.data, buffer.shape[1], buffer.shape[0], buffer.strides[0], image_format)
+    q_image.buffer = buffer
+    return q_image
+
+def toPixmap(bgra_image):
+    # fromImage copies into the pixmap, the borrowed buffer can go once it returns
+    return QPixmap.fromImage(toQImage(bgra_image))
+
+class RenderCache:
+    """Ready-to-show gauge pixmaps keyed by (souls, necrosis, deathsparks, scale).
+
+    Untracked buffs use a count of None and are left out of the composite.
+    `render_assets` are the modular layers already resized to `base_scale`;
+    other scales are resized from them once per scale. Pixmaps are evicted
+    least recently used first once they take more than `budget_bytes`.
+    `gauge_shape` is the gauge's shape at `base_scale`, only needed when
+    no layer is loaded at all, e.g. when no tracked buff has gauge layers.
+    """
+
+    def __init__(self, render_assets, base_scale=1.0, budget_bytes=64 * 1024 * 1024, gauge_shape=None):
+        self.render_assets = render_assets
+        self.base_scale = base_scale
+        self.gauge_shape = next((layer.shape for layers in render_assets.values() for layer in layers.values()), gauge_shape)
+        self.budget_bytes = budget_bytes
+        self.pixmaps = OrderedDict()
+        self.used_bytes = 0
+        self.layer_scale = None
+        self.scaled_layers = {}
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, counts, scale):
+        return tuple(counts.get(name) for name in BUFFS) + (round(scale, 4),)
+
+    def layer(self, name, count, scale):
+        if scale != self.layer_scale:
+            # Only one scale is ever live, older resized layers are dropped
+            self.scaled_layers = {}
+            self.layer_scale = scale
+        layer = self.scaled_layers.get((name, count))
+        if layer is None:
+            layer = self.render_assets[name][count]
+            factor = scale / self.base_scale
+            if abs(factor - 1) > 1e-6:
+                layer = cv2.resize(self.render_assets[name][count], (int(layer.shape[1] * factor), int(layer.shape[0] * factor)))
+            self.scaled_layers[(name, count)] = layer
+        return layer
+
+    def build(self, counts, scale):
+        # States without a layer, e.g. of a buff declared without gauge art, are left out
+        layers = [self.layer(name, counts[name], scale) for name in BUFFS if counts.get(name) in self.render_assets.get(name, {})]
+        if not layers:
+            # Nothing to draw, show a blank transparent image of the gauge's size
+            factor = scale / self.base_scale
+            height, width = (int(side * factor) for side in self.gauge_shape[:2]) if self.gauge_shape is not None else (1, 1)
+            return toPixmap(np.zeros((max(1, height), max(1, width), 4), dtype=np.uint8))
+        return toPixmap(compositeLayers(layers))
+
+    def get(self, counts, scale):
+        key = self.key(counts, scale)
+        pixmap = self.pixmaps.get(key)
+        if pixmap is not None:
+            self.pixmaps.move_to_end(key)
+            self.hits += 1
+            return pixmap
+        self.misses += 1
+        pixmap = self.build(counts, scale)
+        self.pixmaps[key] = pixmap
+        self.used_bytes += pixmap.width() * pixmap.height() * 4
+        while self.used_bytes > self.budget_bytes and len(self.pixmaps) > 1:
+            _, evicted = self.pixmaps.popitem(last=False)
+            self.used_bytes -= evicted.width() * evicted.height() * 4
+        return pixmap
+
+    def prewarm(self, tracked_buffs, scale):
+        """Builds every state of the tracked buffs up front, stopping once the budget is full."""
+        choices = [sorted(self.render_assets[name]) if name in tracked_buffs and self.render_assets.get(name) else [None] for name in BUFFS]
+        for state in product(*choices):
+            if self.pixmaps and self.used_bytes + self.used_bytes / len(self.pixmaps) > self.budget_bytes:
+                break
+            self.get(dict(zip(BUFFS, state)), scale)
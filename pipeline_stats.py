@@ -0,0 +1,92 @@
+import csv
+import json
+import os
+import time
+
+import numpy as np
+
+# Display order of the stages, anything else recorded is listed after these
+PIPELINE_STAGES = ('capture', 'gray', 'change', 'souls', 'necrosis', 'deathsparks', 'tick', 'compose', 'paint')
+
+class LatencyRing:
+    """The last `size` timings of one stage in ms, oldest overwritten first."""
+
+    __slots__ = ('values', 'index', 'count')
+
+    def __init__(self, size=1024):
+        self.values = np.zeros(size, dtype=np.float32)
+        self.index = 0
+        # Total ever recorded, the ring only holds the latest `size` of them
+        self.count = 0
+
+    def append(self, ms):
+        self.values[self.index] = ms
+        self.index = (self.index + 1) % len(self.values)
+        self.count += 1
+
+    def snapshot(self):
+        return self.values[:min(self.count, len(self.values))].copy()
+
+class PipelineStats:
+    """Latency rings for every pipeline stage, shared by the worker and the GUI thread.
+
+    Each stage is only written by one thread, so appends take no lock and
+    readers just copy the ring. `setdefault` makes it a drop-in for the
+    timings dict filled by NecroDetector.detect.
+    """
+
+    def __init__(self, size=1024):
+        self.size = size
+        self.rings = {stage: LatencyRing(size) for stage in PIPELINE_STAGES}
+
+    def setdefault(self, stage, default=None):
+        ring = self.rings.get(stage)
+        if ring is None:
+            ring = self.rings[stage] = LatencyRing(self.size)
+        return ring
+
+    def record(self, stage, ms):
+        self.setdefault(stage).append(ms)
+
+    def summary(self):
+        stages = list(PIPELINE_STAGES) + sorted(stage for stage in list(self.rings) if stage not in PIPELINE_STAGES)
+        summary = {}
+        for stage in stages:
+            ring = self.rings[stage]
+            values = ring.snapshot()
+            if not len(values):
+                continue
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            summary[stage] = {'count': ring.count, 'p50': float(p50), 'p95': float(p95), 'p99': float(p99), 'max': float(values.max())}
+        return summary
+
+    def formatSummary(self):
+        lines = [f"{'stage':<12}{'p50':>8}{'p95':>8}{'p99':>8}{'max':>8} ms"]
+        for stage, values in self.summary().items():
+            lines.append(f"{stage:<12}{values['p50']:8.2f}{values['p95']:8.2f}{values['p99']:8.2f}{values['max']:8.2f}")
+        return '\n'.join(lines)
+
+class MetricsLog:
+    """Appends periodic stats summaries to a .csv file (one row per stage) or a JSON-lines file."""
+
+    CSV_COLUMNS = ('time', 'stage', 'count', 'p50', 'p95', 'p99', 'max')
+
+    def __init__(self, path, stats):
+        self.path = path
+        self.stats = stats
+        self.as_csv = path.lower().endswith('.csv')
+
+    def write(self, extra=None):
+        summary = self.stats.summary()
+        timestamp = round(time.time(), 3)
+        if self.as_csv:
+            new_file = not os.path.exists(self.path)
+            with open(self.path, 'a', newline='') as f:
+                writer = csv.writer(f)
+                if new_file:
+                    writer.writerow(self.CSV_COLUMNS)
+                for stage, values in summary.items():
+                    writer.writerow([timestamp, stage] + [round(values[column], 3) for column in self.CSV_COLUMNS[2:]])
+        else:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps({'time': timestamp, 'stages': summary, **(extra or {})}) + '\n')
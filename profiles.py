@@ -0,0 +1,82 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+def profileConfigs(config):
+    """(name, config) for every gauge config.json describes.
+
+    Without a `profiles` key there is one unnamed gauge. Otherwise each
+    entry of `profiles` is one game client: its keys (main_roi,
+    image_position, scale, resolution...) override the top-level ones.
+    """
+    profiles = config.get('profiles')
+    if not profiles:
+        return [(None, config)]
+    base = {key: value for key, value in config.items() if key != 'profiles'}
+    return [(name, {**base, **overrides}) for name, overrides in profiles.items()]
+
+def profilePath(path, profile):
+    """`path` with the profile name appended, so profiles do not write over each other's files."""
+    if profile is None:
+        return path
+    root, extension = os.path.splitext(path)
+    return f'{root}_{profile}{extension}'
+
+class SharedDetection:
+    """What the detection of every gauge in the process shares.
+
+    One matcher pool sized to the cores runs the matching of all profiles,
+    the asset bundle is mapped once, and profiles using the same asset set
+    and buffs share one (read-only) template bank.
+    """
+
+    def __init__(self, workers=None):
+        self.executor = ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 4, thread_name_prefix='matcher')
+        self.lock = threading.Lock()
+        self.asset_bundle = None
+        self.bundle_opened = False
+        self.template_banks = {}
+        self.event_stream = None
+        self.event_stream_opened = False
+
+    def assetBundle(self, path, base_path, custom_path, scales):
+        """The bundle at `path`, opened by the first profile to ask. Later profiles reuse it as it is."""
+        from asset_bundle import openAssetBundle
+
+        with self.lock:
+            if not self.bundle_opened:
+                self.bundle_opened = True
+                try:
+                    self.asset_bundle = openAssetBundle(path, base_path, custom_path, scales)
+                except Exception as e:
+                    print(f"An error occurred: {e}")
+            return self.asset_bundle
+
+    def templateBank(self, template_path, buffs, packed_templates=None):
+        from template_bank import loadTemplateBank
+
+        key = (os.path.abspath(template_path), tuple(buffs))
+        with self.lock:
+            template_bank = self.template_banks.get(key)
+            if template_bank is None:
+                template_bank = loadTemplateBank(template_path, buffs, packed_templates)
+                self.template_banks[key] = template_bank
+            return template_bank
+
+    def eventStream(self, port):
+        """One event stream for every profile, events carry the profile's name."""
+        from event_stream import EventStream
+
+        with self.lock:
+            if not self.event_stream_opened:
+                self.event_stream_opened = True
+                try:
+                    self.event_stream = EventStream('127.0.0.1', port).start()
+                except OSError as e:
+                    print(f"An error occurred: {e}")
+            return self.event_stream
+
+    def shutdown(self):
+        if self.event_stream is not None:
+            self.event_stream.close()
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,192 @@
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+import mss
+
+from frame_recording import FrameRecording, isRecording
+
+REPLAY_IMAGE_EXTENSIONS = ('.png', '.bmp', '.jpg', '.jpeg')
+
+class CaptureBackend:
+    """Long-lived source of BGRA frames for the scanning region.
+
+    A backend is opened once and then grabbed from every tick. Each grab
+    fills the same preallocated buffer, so callers must copy the frame if
+    they need it to outlive the tick.
+    """
+
+    def __init__(self, roi):
+        self.roi = dict(roi)
+        self.frame = np.zeros((self.roi['height'], self.roi['width'], 4), dtype=np.uint8)
+        self.last_grab_ms = 0.0
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def setROI(self, roi):
+        self.roi = dict(roi)
+        if self.frame.shape[:2] != (self.roi['height'], self.roi['width']):
+            self.frame = np.zeros((self.roi['height'], self.roi['width'], 4), dtype=np.uint8)
+
+    def grab(self):
+        start_time = time.perf_counter()
+        self.grabInto(self.frame)
+        self.last_grab_ms = (time.perf_counter() - start_time) * 1000
+        return self.frame
+
+    def grabInto(self, frame):
+        raise NotImplementedError
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class MssCaptureBackend(CaptureBackend):
+    """Grabs the live screen through a single persistent mss session."""
+
+    def __init__(self, roi):
+        super().__init__(roi)
+        self.sct = None
+
+    def open(self):
+        if self.sct is None:
+            self.sct = mss.mss()
+
+    def close(self):
+        if self.sct is not None:
+            self.sct.close()
+            self.sct = None
+
+    def grabInto(self, frame):
+        if self.sct is None:
+            self.open()
+        screenshot = self.sct.grab(self.roi)
+        np.copyto(frame, np.frombuffer(screenshot.raw, dtype=np.uint8).reshape(screenshot.height, screenshot.width, 4))
+
+class ReplayCaptureBackend(CaptureBackend):
+    """Plays back recorded ROI frames from a recording, a directory of images or a video file.
+
+    Frames are served in order and loop forever, which makes the backend a
+    drop-in stand-in for the live screen on machines without a display.
+    """
+
+    def __init__(self, source, roi=None, loop=True):
+        super().__init__(roi or {'left': 0, 'top': 0, 'width': 1, 'height': 1})
+        self.source = source
+        self.loop = loop
+        self.frames = []
+        self.video = None
+        self.position = 0
+
+    def open(self):
+        if isRecording(self.source):
+            if not len(self.frames):
+                self.frames = FrameRecording(self.source).frames
+            first_frame = self.frames[0]
+        elif os.path.isdir(self.source):
+            if not len(self.frames):
+                for name in sorted(os.listdir(self.source)):
+                    if name.lower().endswith(REPLAY_IMAGE_EXTENSIONS):
+                        img_buffer = cv2.imread(os.path.join(self.source, name), cv2.IMREAD_UNCHANGED)
+                        if img_buffer is None:
+                            continue
+                        img_buffer = toBGRA(img_buffer)
+                        # Keep every frame the size of the first one so the buffer never reallocates
+                        if self.frames and img_buffer.shape != self.frames[0].shape:
+                            img_buffer = cv2.resize(img_buffer, (self.frames[0].shape[1], self.frames[0].shape[0]))
+                        self.frames.append(img_buffer)
+                if not self.frames:
+                    raise ValueError(f"No replay frames found in {self.source}")
+            first_frame = self.frames[0]
+        else:
+            if self.video is None:
+                self.video = cv2.VideoCapture(self.source)
+                if not self.video.isOpened():
+                    raise ValueError(f"Could not open replay video {self.source}")
+            ok, first_frame = self.video.read()
+            if not ok:
+                raise ValueError(f"Replay video {self.source} has no frames")
+            first_frame = toBGRA(first_frame)
+            self.video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        self.position = 0
+        self.setROI({'left': 0, 'top': 0, 'width': first_frame.shape[1], 'height': first_frame.shape[0]})
+
+    def close(self):
+        if self.video is not None:
+            self.video.release()
+            self.video = None
+
+    def grabInto(self, frame):
+        if len(self.frames):
+            if self.position >= len(self.frames):
+                if not self.loop:
+                    raise EOFError("Replay finished")
+                self.position = 0
+            img_buffer = toBGRA(self.frames[self.position])
+        else:
+            if self.video is None:
+                self.open()
+            ok, img_buffer = self.video.read()
+            if not ok:
+                if not self.loop:
+                    raise EOFError("Replay finished")
+                self.video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                ok, img_buffer = self.video.read()
+            img_buffer = toBGRA(img_buffer)
+        self.position += 1
+        np.copyto(frame, img_buffer)
+
+def toBGRA(img_buffer):
+    if img_buffer.ndim == 2:
+        return cv2.cvtColor(img_buffer, cv2.COLOR_GRAY2BGRA)
+    if img_buffer.shape[2] == 3:
+        return cv2.cvtColor(img_buffer, cv2.COLOR_BGR2BGRA)
+    return img_buffer
+
+def createCaptureBackend(roi, source=None):
+    """Returns the live mss backend, or a replay backend when `source` points at recorded frames."""
+    if source:
+        return ReplayCaptureBackend(source, roi)
+    return MssCaptureBackend(roi)
+
+def primaryMonitorROI():
+    with mss.mss() as sct:
+        monitor = sct.monitors[1]
+    return {'left': monitor['left'], 'top': monitor['top'], 'width': monitor['width'], 'height': monitor['height']}
+
+def grabScreenshot(roi=None):
+    """One-off BGRA grab of `roi`, the whole primary monitor by default."""
+    with MssCaptureBackend(roi or primaryMonitorROI()) as backend:
+        return backend.grab().copy()
+
+def measureCaptureLatency(backend, frames=200):
+    timings = []
+    with backend:
+        for _ in range(frames):
+            backend.grab()
+            timings.append(backend.last_grab_ms)
+    timings = np.array(timings)
+    return {
+        'frames': frames,
+        'mean_ms': float(timings.mean()),
+        'p50_ms': float(np.percentile(timings, 50)),
+        'p95_ms': float(np.percentile(timings, 95)),
+        'max_ms': float(timings.max()),
+    }
+
+if __name__ == '__main__':
+    # Usage: python screen_capture.py [replay_dir_or_video] [frames]
+    source = sys.argv[1] if len(sys.argv) > 1 else None
+    frames = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    backend = createCaptureBackend({'left': 0, 'top': 0, 'width': 795, 'height': 160}, source)
+    for key, value in measureCaptureLatency(backend, frames).items():
+        print(f"{key}: {value:.3f}" if isinstance(value, float) else f"{key}: {value}")
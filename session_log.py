@@ -0,0 +1,223 @@
+import argparse
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from buff_registry import BUFFS
+
+SESSION_MAGIC = b'NGSL'
+SESSION_VERSION = 2
+SESSION_SUFFIX = '.ngsl'
+# Buffs and their highest stack counts in version 1 logs, which did not name them
+V1_BUFFS = {'souls': 5, 'necrosis': 12, 'deathsparks': 5}
+
+HEADER_DTYPE = np.dtype([('magic', 'S4'), ('version', '<u2'), ('heartbeat_ms', '<u2'), ('start', '<f8')])
+# From version 2 the header is followed by the byte length of a JSON list of [buff, max stacks], then that list
+BUFF_LIST_LENGTH_DTYPE = np.dtype('<u4')
+
+def recordDtype(buff_count):
+    # 4 bytes per record plus 2 per buff: milliseconds since the previous record, then counts and confidences (0-255)
+    return np.dtype([('dt_ms', '<u4'), ('counts', 'u1', (buff_count,)), ('confidence', 'u1', (buff_count,))])
+
+class SessionLog:
+    """Appends the stack counts of one session to a compact binary timeline.
+
+    A record is kept when any count changes, and at least every `heartbeat`
+    seconds so stretches without changes still have confidences and gaps in
+    the log can be told apart from quiet fights. Records go into a fixed
+    in-memory ring; a background thread appends it to disk in bulk every
+    `flush_interval` seconds, so `record` never touches the file. Records
+    that arrive while the ring is full are dropped and counted. Every
+    registered buff gets a column, the header names them.
+    """
+
+    def __init__(self, folder, capacity=4096, flush_interval=2.0, heartbeat=1.0, profile=None):
+        os.makedirs(folder, exist_ok=True)
+        self.start = time.time()
+        name = time.strftime('%Y-%m-%d_%H-%M-%S', time.localtime(self.start)) + (f'_{profile}' if profile is not None else '')
+        self.path = os.path.join(folder, name + SESSION_SUFFIX)
+        self.heartbeat = heartbeat
+        self.flush_interval = flush_interval
+        self.buffs = list(BUFFS)
+        self.ring = np.zeros(capacity, dtype=recordDtype(len(self.buffs)))
+        self.written = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.last_ms = 0
+        self.last_counts = None
+        self.last_time = None
+        self.lock = threading.Lock()
+        self.flush_event = threading.Event()
+        self.closed = False
+
+        self.file = open(self.path, 'ab')
+        header = np.zeros(1, dtype=HEADER_DTYPE)
+        header[0] = (SESSION_MAGIC, SESSION_VERSION, int(heartbeat * 1000), self.start)
+        self.file.write(header.tobytes())
+        buff_list = json.dumps([[name, BUFFS[name].max_stacks] for name in self.buffs]).encode()
+        self.file.write(np.array(len(buff_list), dtype=BUFF_LIST_LENGTH_DTYPE).tobytes() + buff_list)
+        self.thread = threading.Thread(target=self.run, name='session-log', daemon=True)
+        self.thread.start()
+
+    def record(self, counts, confidences, timestamp, force=False):
+        """Adds one tick's counts, a no-op unless they changed or the heartbeat is due."""
+        if not force and counts == self.last_counts and timestamp - self.last_time < self.heartbeat:
+            return
+        now_ms = max(self.last_ms, int(round((timestamp - self.start) * 1000)))
+        row = (now_ms - self.last_ms, tuple(counts.get(name, 0) for name in self.buffs), tuple(min(255, max(0, int(confidences.get(name, 0.0) * 255))) for name in self.buffs))
+        capacity = len(self.ring)
+        with self.lock:
+            if self.written - self.flushed >= capacity:
+                # The next kept record spans the gap, so the time is still attributed to the last known counts
+                self.dropped += 1
+                return
+            self.ring[self.written % capacity] = row
+            self.written += 1
+            pending = self.written - self.flushed
+        self.last_ms = now_ms
+        self.last_counts = dict(counts)
+        self.last_time = timestamp
+        if pending >= capacity // 2:
+            self.flush_event.set()
+
+    def run(self):
+        while True:
+            self.flush_event.wait(self.flush_interval)
+            self.flush_event.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"An error occurred: {e}")
+            if self.closed:
+                return
+
+    def flush(self):
+        with self.lock:
+            start, end = self.flushed, self.written
+            rows = self.ring[np.arange(start, end) % len(self.ring)]
+        if len(rows):
+            self.file.write(rows.tobytes())
+            self.file.flush()
+        with self.lock:
+            self.flushed = end
+
+    def close(self):
+        if self.closed:
+            return
+        # A closing record gives the last counts their duration
+        if self.last_counts is not None:
+            self.record(self.last_counts, {}, time.time(), force=True)
+        self.closed = True
+        self.flush_event.set()
+        self.thread.join()
+        self.file.close()
+        if self.dropped:
+            print(f"Session log dropped {self.dropped} records")
+
+class Session:
+    """Read side of one session log, the whole timeline as NumPy arrays.
+
+    `buffs` maps the logged buffs, in column order, to their highest stack count.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)
+        if len(header) == 0 or header[0]['magic'] != SESSION_MAGIC:
+            raise ValueError(f"{path} is not a session log")
+        version = header[0]['version']
+        self.start = float(header[0]['start'])
+        self.heartbeat = header[0]['heartbeat_ms'] / 1000
+        offset = HEADER_DTYPE.itemsize
+        if version == 1:
+            self.buffs = dict(V1_BUFFS)
+        elif version == 2:
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                length = int(np.frombuffer(f.read(BUFF_LIST_LENGTH_DTYPE.itemsize), dtype=BUFF_LIST_LENGTH_DTYPE)[0])
+                self.buffs = dict(json.loads(f.read(length)))
+            offset += BUFF_LIST_LENGTH_DTYPE.itemsize + length
+        else:
+            raise ValueError(f"{path} has unsupported session log version {version}")
+        record_dtype = recordDtype(len(self.buffs))
+        # A log cut short mid-record, e.g. by a crash, keeps its complete records
+        count = (os.path.getsize(path) - offset) // record_dtype.itemsize
+        records = np.fromfile(path, dtype=record_dtype, count=count, offset=offset)
+        self.times = np.cumsum(records['dt_ms'], dtype=np.int64) / 1000
+        self.counts = records['counts']
+        self.confidence = records['confidence'] / 255
+
+    def __len__(self):
+        return len(self.times)
+
+    def durations(self, max_gap=None):
+        """Seconds each record's counts lasted, gaps longer than `max_gap` (3 heartbeats) count as not tracked."""
+        if len(self.times) == 0:
+            return np.zeros(0)
+        durations = np.diff(self.times, append=self.times[-1])
+        max_gap = max_gap if max_gap is not None else 3 * self.heartbeat
+        return np.where(durations <= max_gap, durations, 0.0)
+
+def stretches(mask, durations):
+    """Durations of every uninterrupted run of records where `mask` holds."""
+    if not mask.any():
+        return np.zeros(0)
+    starts = mask & ~np.concatenate(([False], mask[:-1]))
+    run_ids = np.cumsum(starts) - 1
+    return np.bincount(run_ids[mask], weights=durations[mask])
+
+def sessionStats(session, max_gap=None):
+    durations = session.durations(max_gap)
+    tracked = float(durations.sum())
+    stats = {'start': session.start, 'tracked_s': round(tracked, 1), 'records': len(session), 'buffs': list(session.buffs)}
+    for index, (name, max_stacks) in enumerate(session.buffs.items()):
+        counts = session.counts[:, index]
+        time_at = np.bincount(counts, weights=durations, minlength=max_stacks + 1)
+        capped = stretches(counts >= max_stacks, durations)
+        seen = counts > 0
+        stats[name] = {
+            'max_stacks': max_stacks,
+            'uptime': round(float(time_at[1:].sum()) / tracked, 4) if tracked else 0.0,
+            'time_at_s': {int(count): round(float(seconds), 1) for count, seconds in enumerate(time_at) if seconds > 0},
+            'capped_s': round(float(capped.sum()), 1),
+            'capped_times': len(capped),
+            'longest_capped_s': round(float(capped.max()), 1) if len(capped) else 0.0,
+            'mean_confidence': round(float(np.average(session.confidence[seen, index], weights=durations[seen])), 3) if durations[seen].sum() > 0 else None,
+        }
+    return stats
+
+def sessionPaths(paths):
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            found.extend(os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith(SESSION_SUFFIX))
+        else:
+            found.append(path)
+    return found
+
+def formatStats(path, stats):
+    lines = [f"{os.path.basename(path)}: {stats['tracked_s'] / 60:.1f} min tracked, {stats['records']} records"]
+    for name in stats['buffs']:
+        buff = stats[name]
+        time_at = ', '.join(f"{count}: {seconds:.0f}s" for count, seconds in buff['time_at_s'].items())
+        lines.append(f"  {name}: uptime {buff['uptime']:.0%}, at {buff['max_stacks']} for {buff['capped_s']:.0f}s ({buff['capped_times']} times, longest {buff['longest_capped_s']:.0f}s)")
+        lines.append(f"    time at each count: {time_at}")
+    return '\n'.join(lines)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Summarises session logs written with `session_log` in config.json.")
+    parser.add_argument('paths', nargs='*', default=['session_logs'], help="Session log files or folders of them")
+    parser.add_argument('--max-gap', type=float, default=None, help="Seconds without records after which time is not counted (default: 3 heartbeats)")
+    parser.add_argument('--json', action='store_true', help="Print one JSON object per session instead")
+    args = parser.parse_args()
+
+    for path in sessionPaths(args.paths):
+        try:
+            stats = sessionStats(Session(path), args.max_gap)
+        except (OSError, ValueError) as e:
+            print(f"Skipping {path}: {e}")
+            continue
+        print(json.dumps({'path': path, **stats}) if args.json else formatStats(path, stats))
@@ -0,0 +1,23 @@
+import time
+
+# Imported before anything heavy, so this is as close to process start as Python gets
+PROCESS_START = time.perf_counter()
+
+class StartupPhases:
+    """Milestones of one launch in ms since PROCESS_START, marked from any thread."""
+
+    def __init__(self, start=PROCESS_START):
+        self.start = start
+        self.phases = []
+
+    def mark(self, phase):
+        self.phases.append((phase, (time.perf_counter() - self.start) * 1000))
+
+    def elapsed(self, phase):
+        for name, ms in self.phases:
+            if name == phase:
+                return ms
+        return None
+
+    def report(self):
+        return 'Startup: ' + ', '.join(f'{phase} {ms:.0f} ms' for phase, ms in self.phases)
@@ -0,0 +1,88 @@
+import os
+from types import MappingProxyType
+
+import cv2
+import numpy as np
+
+from buff_registry import BUFFS
+
+class BuffTemplates:
+    """Grayscale templates of one buff with their sizes and stack counts, frozen after loading."""
+
+    __slots__ = ('name', 'templates', 'sizes', 'counts')
+
+    def __init__(self, name, templates, counts):
+        frozen = []
+        for template in templates:
+            template = np.ascontiguousarray(template, dtype=np.uint8)
+            template.setflags(write=False)
+            frozen.append(template)
+        object.__setattr__(self, 'name', name)
+        object.__setattr__(self, 'templates', tuple(frozen))
+        object.__setattr__(self, 'sizes', tuple((t.shape[1], t.shape[0]) for t in frozen))
+        object.__setattr__(self, 'counts', tuple(counts))
+
+    def __setattr__(self, key, value):
+        raise AttributeError("BuffTemplates is immutable")
+
+    def __len__(self):
+        return len(self.templates)
+
+class TemplateBank:
+    """All buff templates for one asset set, built once per config."""
+
+    def __init__(self, asset_path_prefix, buffs):
+        self.asset_path_prefix = asset_path_prefix
+        self.buffs = MappingProxyType(dict(buffs))
+
+    def __getitem__(self, name):
+        return self.buffs[name]
+
+    def __contains__(self, name):
+        return name in self.buffs
+
+    def __iter__(self):
+        return iter(self.buffs.values())
+
+def availableAssetSets(base_path):
+    """Every resolution/scaling/size folder under assets, e.g. 'reso_3840x2160/150/medium'."""
+    asset_sets = []
+    assets_path = os.path.join(base_path, 'assets')
+    for resolution in sorted(os.listdir(assets_path)):
+        if not resolution.startswith('reso_'):
+            continue
+        for windows_scaling in sorted(os.listdir(os.path.join(assets_path, resolution))):
+            for buffbar_size in sorted(os.listdir(os.path.join(assets_path, resolution, windows_scaling))):
+                asset_sets.append(f'{resolution}/{windows_scaling}/{buffbar_size}')
+    return asset_sets
+
+def loadTemplate(asset_path_prefix, file_name):
+    path = os.path.join(asset_path_prefix, f'{file_name}.png')
+    if not os.path.exists(path):
+        return None
+    img_buffer = cv2.imread(path, cv2.IMREAD_COLOR)
+    if img_buffer is None:
+        return None
+    return cv2.cvtColor(img_buffer, cv2.COLOR_BGR2GRAY)
+
+def loadTemplateBank(asset_path_prefix, buff_names, packed_templates=None):
+    """Decodes and converts every template of the tracked buffs, skipping files missing from the set.
+
+    `packed_templates` maps file names to ready grayscale arrays, e.g. from an
+    asset bundle, and replaces decoding the PNGs when given.
+    """
+    buffs = {}
+    for name in buff_names:
+        templates = []
+        counts = []
+        for file_name, count in BUFFS[name].templates:
+            if packed_templates:
+                template = packed_templates.get(file_name)
+            else:
+                template = loadTemplate(asset_path_prefix, file_name)
+            if template is None:
+                continue
+            templates.append(template)
+            counts.append(count)
+        buffs[name] = BuffTemplates(name, templates, counts)
+    return TemplateBank(asset_path_prefix, buffs)
@@ -0,0 +1,237 @@
+import argparse
+import hashlib
+import json
+import math
+import os
+
+import cv2
+import numpy as np
+
+from atomic_write import atomicPath
+from buff_registry import BUFFS
+from template_bank import availableAssetSets
+from buff_matching import MATCH_THRESHOLD, findImage
+from detector import toGray
+
+SYNTHESIZED_ASSETS = 'synthesized_assets'
+SYNTHESIS_VERSION = 1
+SYNTHESIS_META = 'synthesis.json'
+# Scale corrections tried on top of the scaling ratio when refining against a captured frame, 2% apart
+REFINE_SCALES = tuple(round(1.02 ** step, 4) for step in range(-11, 12))
+# Lowest score at which a synthesized template is taken to be the icon in a captured frame
+REFINE_MIN_SCORE = 0.75
+
+def templateFileNames(buffs=None):
+    return [file_name for name, buff in BUFFS.items() if buffs is None or name in buffs for file_name, _ in buff.templates]
+
+def shippedPath(base_path, asset_set):
+    return os.path.join(base_path, 'assets', *asset_set.split('/'))
+
+def templateDir(base_path, resolution, windows_scaling, buffbar_size):
+    """Bundle key and folder of an asset set, a shipped folder wins over a synthesized one."""
+    shipped = os.path.join(base_path, 'assets', resolution, str(windows_scaling), buffbar_size)
+    if os.path.isdir(shipped):
+        return f'assets/{resolution}/{windows_scaling}/{buffbar_size}', shipped
+    return f'{SYNTHESIZED_ASSETS}/{resolution}/{windows_scaling}/{buffbar_size}', os.path.join(SYNTHESIZED_ASSETS, resolution, str(windows_scaling), buffbar_size)
+
+def rankSources(base_path, windows_scaling, buffbar_size, resolution=None):
+    """Shipped asset sets of the same buffbar size, closest Windows scaling first.
+
+    Icon size only depends on the scaling and the buffbar size, so the
+    resolution is just a tie breaker. Downscaling keeps more detail than
+    upscaling, so a larger source wins over an equally distant smaller one.
+    """
+    candidates = []
+    for asset_set in availableAssetSets(base_path):
+        source_resolution, source_scaling, source_size = asset_set.split('/')
+        if source_size != buffbar_size or not source_scaling.isdigit():
+            continue
+        ratio = int(windows_scaling) / int(source_scaling)
+        candidates.append(((round(abs(math.log(ratio)), 6), ratio > 1, source_resolution != resolution), asset_set))
+    return [asset_set for _, asset_set in sorted(candidates)]
+
+def rescaleTemplate(template, factor):
+    h, w = template.shape[:2]
+    size = (max(1, round(w * factor)), max(1, round(h * factor)))
+    return cv2.resize(template, size, interpolation=cv2.INTER_AREA if factor < 1 else cv2.INTER_LINEAR)
+
+def matchScore(template, image, margin=3):
+    """Best score of the template's inner part on the image, tolerating crops that differ by a few pixels at the edges."""
+    inner = toGray(template)[margin:-margin, margin:-margin]
+    padded = cv2.copyMakeBorder(toGray(image), 4, 4, 4, 4, cv2.BORDER_REPLICATE)
+    if inner.shape[0] > padded.shape[0] or inner.shape[1] > padded.shape[1]:
+        return 0.0
+    return float(cv2.minMaxLoc(cv2.matchTemplate(padded, inner, cv2.TM_CCOEFF_NORMED))[1])
+
+def synthesizeTemplates(base_path, windows_scaling, buffbar_size, resolution=None, correction=1.0):
+    """Rescales every template from the closest shipped set that has it.
+
+    Returns the BGR templates by file name, their source sets and a check
+    score per template: 1 when copied at the same scaling, otherwise how
+    well it agrees with the same template rescaled from the next closest
+    source of another scaling, or None when there is none.
+    """
+    sources = rankSources(base_path, windows_scaling, buffbar_size, resolution)
+    templates = {}
+    template_sources = {}
+    check_scores = {}
+    for file_name in templateFileNames():
+        found = [(asset_set, os.path.join(shippedPath(base_path, asset_set), f'{file_name}.png')) for asset_set in sources]
+        found = [(asset_set, path) for asset_set, path in found if os.path.exists(path)]
+        if not found:
+            continue
+        # The check source is the closest one of another scaling, other resolutions of the same scaling hold identical icons
+        found = found[:1] + [(asset_set, path) for asset_set, path in found if asset_set.split('/')[1] != found[0][0].split('/')[1]][:1]
+        rescaled = []
+        for asset_set, path in found:
+            factor = int(windows_scaling) / int(asset_set.split('/')[1])
+            rescaled.append((factor, rescaleTemplate(cv2.imread(path, cv2.IMREAD_COLOR), factor * correction)))
+        templates[file_name] = rescaled[0][1]
+        template_sources[file_name] = found[0][0]
+        if rescaled[0][0] == 1 and correction == 1:
+            check_scores[file_name] = 1.0
+        elif len(rescaled) > 1:
+            check_scores[file_name] = matchScore(rescaled[0][1], rescaled[1][1])
+        else:
+            check_scores[file_name] = None
+    return templates, template_sources, check_scores
+
+def refineTemplates(base_path, windows_scaling, buffbar_size, frame, resolution=None):
+    """Synthesizes a set and fits it to a captured frame showing some of the buffs.
+
+    The best template of each visible buff is searched at a few scales
+    around the scaling ratio and replaced by the frame's own pixels. The
+    median scale correction of those finds is applied to every other
+    template. Only one template per buff is taken from the frame, since a
+    wrong count's template can still score well on the icon.
+    """
+    templates, template_sources, check_scores = synthesizeTemplates(base_path, windows_scaling, buffbar_size, resolution)
+    frame_gray = toGray(frame)
+    finds = {}
+    for name, buff in BUFFS.items():
+        for file_name, _ in buff.templates:
+            if file_name not in templates:
+                continue
+            for correction in REFINE_SCALES:
+                scaled = toGray(rescaleTemplate(templates[file_name], correction))
+                if scaled.shape[0] > frame_gray.shape[0] or scaled.shape[1] > frame_gray.shape[1]:
+                    continue
+                x, y, w, h, score = findImage(scaled, frame_gray)
+                if score >= REFINE_MIN_SCORE and (name not in finds or score > finds[name][1]):
+                    finds[name] = (file_name, score, correction, (x, y, w, h))
+
+    correction = float(np.median([find[2] for find in finds.values()])) if finds else 1.0
+    if correction != 1.0:
+        templates, template_sources, check_scores = synthesizeTemplates(base_path, windows_scaling, buffbar_size, resolution, correction)
+    frame_scores = {}
+    for file_name, score, _, (x, y, w, h) in finds.values():
+        templates[file_name] = np.ascontiguousarray(frame[y:y + h, x:x + w, :3])
+        template_sources[file_name] = 'frame'
+        check_scores[file_name] = 1.0
+        frame_scores[file_name] = round(score, 4)
+    return templates, template_sources, check_scores, frame_scores, correction
+
+def sourceKey(base_path, windows_scaling, buffbar_size, resolution=None):
+    """Changes whenever the parameters, the generator or any shipped source template changes."""
+    digest = hashlib.sha256(f'{SYNTHESIS_VERSION}/{windows_scaling}/{buffbar_size}/{resolution}'.encode())
+    for asset_set in rankSources(base_path, windows_scaling, buffbar_size, resolution):
+        for file_name in templateFileNames():
+            path = os.path.join(shippedPath(base_path, asset_set), f'{file_name}.png')
+            if os.path.exists(path):
+                digest.update(f'{asset_set}/{file_name}'.encode())
+                with open(path, 'rb') as f:
+                    digest.update(f.read())
+    return digest.hexdigest()
+
+def loadMeta(path):
+    meta_path = os.path.join(path, SYNTHESIS_META)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, 'r') as f:
+        return json.load(f)
+
+def synthesizeAssetSet(base_path, resolution, windows_scaling, buffbar_size, frame=None, cache_path=SYNTHESIZED_ASSETS):
+    """Folder of templates for any resolution, Windows scaling and buffbar size, generated once and cached.
+
+    The cache folder mirrors assets/ and is reused as long as its key
+    matches. Passing a captured frame always regenerates the set fitted to
+    that frame, and a refined set is kept until the shipped sources change.
+    """
+    path = os.path.join(cache_path, resolution, str(windows_scaling), buffbar_size)
+    key = sourceKey(base_path, windows_scaling, buffbar_size, resolution)
+    meta = loadMeta(path)
+    if frame is None and meta is not None and meta.get('key') == key:
+        return path
+
+    if frame is None:
+        templates, template_sources, check_scores = synthesizeTemplates(base_path, windows_scaling, buffbar_size, resolution)
+        frame_scores, correction = {}, 1.0
+    else:
+        templates, template_sources, check_scores, frame_scores, correction = refineTemplates(base_path, windows_scaling, buffbar_size, frame, resolution)
+    if not templates:
+        raise ValueError(f"No shipped {buffbar_size} templates to synthesize {resolution}/{windows_scaling}/{buffbar_size} from")
+
+    with atomicPath(path) as temp_path:
+        os.makedirs(temp_path)
+        for file_name, template in templates.items():
+            cv2.imwrite(os.path.join(temp_path, f'{file_name}.png'), template)
+        with open(os.path.join(temp_path, SYNTHESIS_META), 'w') as f:
+            json.dump({'version': SYNTHESIS_VERSION, 'key': key, 'refined': frame is not None, 'correction': correction,
+                       'sources': template_sources, 'check_scores': check_scores, 'frame_scores': frame_scores}, f, indent=1)
+
+    weak = sorted(file_name for file_name, score in check_scores.items() if score is not None and score < MATCH_THRESHOLD)
+    if weak:
+        print(f"Synthesized templates may miss stacks ({', '.join(weak)}), refine them with a screenshot: python template_synthesis.py {resolution} {windows_scaling} {buffbar_size} --frame <screenshot>")
+    return path
+
+def crossCheck(base_path):
+    """Synthesizes every shipped set from the other shipped sets and scores the result against the real templates."""
+    results = {}
+    asset_sets = availableAssetSets(base_path)
+    for asset_set in asset_sets:
+        resolution, windows_scaling, buffbar_size = asset_set.split('/')
+        # Only sets of another scaling count as sources, the same scaling at another resolution is identical
+        others = [other for other in asset_sets if other.split('/')[1] != windows_scaling]
+        scores = []
+        for file_name in templateFileNames():
+            real_path = os.path.join(shippedPath(base_path, asset_set), f'{file_name}.png')
+            sources = [other for other in rankSources(base_path, windows_scaling, buffbar_size, resolution) if other in others]
+            sources = [other for other in sources if os.path.exists(os.path.join(shippedPath(base_path, other), f'{file_name}.png'))]
+            if not os.path.exists(real_path) or not sources:
+                continue
+            factor = int(windows_scaling) / int(sources[0].split('/')[1])
+            synthesized = rescaleTemplate(cv2.imread(os.path.join(shippedPath(base_path, sources[0]), f'{file_name}.png'), cv2.IMREAD_COLOR), factor)
+            scores.append(matchScore(synthesized, cv2.imread(real_path, cv2.IMREAD_COLOR)))
+        if scores:
+            results[asset_set] = {'templates': len(scores), 'min': min(scores), 'mean': float(np.mean(scores))}
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generates buff templates for a resolution, Windows scaling and buffbar size without shipped assets.')
+    parser.add_argument('resolution', nargs='?', help="e.g. reso_3440x1440")
+    parser.add_argument('windows_scaling', nargs='?', help="e.g. 175")
+    parser.add_argument('buffbar_size', nargs='?', choices=['small', 'medium', 'large'])
+    parser.add_argument('--frame', help='Screenshot or ROI capture showing some of the buffs, the templates are fitted to it.')
+    parser.add_argument('--check', action='store_true', help='Rebuild every shipped set from the others and report how well the rescaled templates match.')
+    args = parser.parse_args()
+
+    base_path = os.path.abspath('.')
+    if args.check:
+        for asset_set, result in crossCheck(base_path).items():
+            print(f"{asset_set:<28} {result['templates']:3d} templates, min {result['min']:.3f}, mean {result['mean']:.3f}")
+    elif args.buffbar_size:
+        frame = None
+        if args.frame:
+            frame = cv2.imread(args.frame, cv2.IMREAD_UNCHANGED)
+            if frame is None:
+                parser.error(f'could not read {args.frame}')
+            if frame.ndim == 2:
+                frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+        path = synthesizeAssetSet(base_path, args.resolution, args.windows_scaling, args.buffbar_size, frame)
+        meta = loadMeta(path)
+        print(f"{path}: {len(meta['sources'])} templates, scale correction {meta['correction']:.2f}")
+        for file_name, source in meta['sources'].items():
+            check_score = meta['check_scores'][file_name]
+            print(f"    {file_name:<16} from {source:<28} check {'-' if check_score is None else f'{check_score:.3f}'}")
+    else:
+        parser.error('give a resolution, Windows scaling and buffbar size, or --check')
@@ -0,0 +1,84 @@
+import time
+
+class TickScheduler:
+    """Paces detection ticks against absolute deadlines.
+
+    Each deadline is counted from the previous deadline, not from when the
+    tick's work finished, so processing time no longer stretches the period.
+    Ticks that were missed are dropped instead of being run back to back.
+
+    With `adaptive` set the period follows the buff bar: `fast_rate` while
+    counts are moving or at/above their `hot_counts`, `idle_rate` once the
+    bar has been empty for `idle_after` seconds, `update_rate` otherwise.
+    Rates are in milliseconds like `update_rate` in config.json.
+    """
+
+    def __init__(self, update_rate, fast_rate=None, idle_rate=None, idle_after=10.0, active_hold=2.0, hot_counts=None, adaptive=True, clock=time.perf_counter):
+        self.active_hold = active_hold
+        self.clock = clock
+        self.setRates(update_rate, fast_rate, idle_rate, idle_after, hot_counts, adaptive)
+
+        self.deadline = None
+        self.last_counts = None
+        self.last_change = None
+        self.last_seen = None
+        self.ticks = 0
+        self.missed_ticks = 0
+
+    def setRates(self, update_rate, fast_rate=None, idle_rate=None, idle_after=10.0, hot_counts=None, adaptive=True):
+        """Changes the rates in place, deadlines, counters and the activity history carry on."""
+        # Rates below 1 ms would give a zero period, which nextDelay divides by
+        update_rate = max(1, update_rate)
+        self.update_rate = update_rate
+        # Without an explicit fast rate, a slow base rate speeds up by half rather than jumping to 25 ms
+        self.fast_rate = max(1, min(update_rate, fast_rate if fast_rate is not None else max(25, update_rate / 2)))
+        self.idle_rate = max(update_rate, idle_rate if idle_rate is not None else 250)
+        self.idle_after = idle_after
+        self.hot_counts = hot_counts or {}
+        self.adaptive = adaptive
+        # The next observe picks the adaptive rate, until then the base rate applies
+        self.period = update_rate / 1000
+
+    def start(self):
+        now = self.clock()
+        self.deadline = now
+        self.last_change = now
+        self.last_seen = now
+
+    def currentRate(self):
+        return self.period * 1000
+
+    def observe(self, counts):
+        """Picks the period for the next tick from the counts this tick produced."""
+        now = self.clock()
+        if counts != self.last_counts:
+            self.last_counts = dict(counts)
+            self.last_change = now
+        if any(counts.values()):
+            self.last_seen = now
+        if not self.adaptive:
+            return
+
+        hot = any(counts.get(name, 0) >= count for name, count in self.hot_counts.items())
+        if hot or now - self.last_change < self.active_hold:
+            rate = self.fast_rate
+        elif now - self.last_seen >= self.idle_after:
+            rate = self.idle_rate
+        else:
+            rate = self.update_rate
+        self.period = rate / 1000
+
+    def nextDelay(self):
+        """Seconds to wait until the next tick's deadline."""
+        now = self.clock()
+        if self.deadline is None:
+            self.deadline = now
+        self.ticks += 1
+        next_deadline = self.deadline + self.period
+        if next_deadline <= now:
+            # Running late: jump to the first deadline still ahead rather than catching up
+            missed = int((now - self.deadline) // self.period)
+            self.missed_ticks += missed
+            next_deadline = self.deadline + (missed + 1) * self.period
+        self.deadline = next_deadline
+        return max(0.0, next_deadline - now)